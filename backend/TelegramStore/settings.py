@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import copy
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.admin',
+    'django.contrib.postgres',
     'store',
     'users',
 ]
@@ -83,10 +85,51 @@ DATABASES = {
         'PORT': os.environ.get('POSTGRES_PORT'),
         'ATOMIC_REQUESTS': True,
         'CONN_MAX_AGE': 0,  # for async db
+        # с пулом проверка выполняется при выдаче соединения из пула
         'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Пул соединений psycopg 3 (DB_POOL=1) для бота и воркеров uvicorn: соединение
+# берётся из пула и возвращается в него вместо открытия на каждый запрос.
+# Пул свой у каждого процесса. По умолчанию его размер равен числу потоков, которые
+# могут одновременно работать с базой: пул sync_to_async/asyncio (ASGI_THREADS,
+# иначе как у ThreadPoolExecutor) плюс поток thread_sensitive.
+if os.environ.get('DB_POOL', '').lower() in ('1', 'true', 'yes'):
+    _executor_threads = int(os.environ.get('ASGI_THREADS') or min(32, (os.cpu_count() or 1) + 4))
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE') or _executor_threads + 1),
+            # сколько ждать свободного соединения, прежде чем отдать ошибку
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            # простаивающие сверх min_size соединения закрываются
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+            'name': 'default',
+        },
+    }
+
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2:5433. Остальные параметры — как
+# у основной базы. Что читается с реплик, решает store.routers.ReplicaRouter.
+DATABASE_REPLICAS = []
+for _index, _host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    _alias = f'replica_{_index}'
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[_alias] = {
+        **copy.deepcopy(DATABASES['default']),
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        # иначе каждый HTTP-запрос открывал бы транзакцию и на репликах
+        'ATOMIC_REQUESTS': False,
+        # в тестах реплика — та же тестовая база
+        'TEST': {'MIRROR': 'default'},
+    }
+    if 'pool' in DATABASES[_alias].get('OPTIONS', {}):
+        DATABASES[_alias]['OPTIONS']['pool']['name'] = _alias
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -18,7 +18,10 @@ from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path
 
+from store.views import db_pool_stats
+
 urlpatterns = [
+    path('admin/db-pool/', db_pool_stats, name='db_pool_stats'),
     path('admin/', admin.site.urls),
 ]
 urlpatterns += staticfiles_urlpatterns()
@@ -1,5 +1,8 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 
+from .exports import CONTENT_TYPES, astream_export, export_items
 from .forms import CategoryForm
 from .models import Category, Product, Cart, CartItem, Order, OrderItem, FAQ
 
@@ -27,12 +30,18 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'is_ordered', 'updated_at')
+    list_display = ('id', 'user', 'is_ordered', 'item_count', 'total_amount', 'updated_at')
     list_filter = ('is_ordered',)
+    readonly_fields = ('total_amount', 'item_count')
     search_fields = ('user__username',)
     search_help_text = 'Поиск по имени пользователя'
     inlines = (CartItemInline,)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # позиции правились мимо бота, итоги корзины пересчитываем целиком
+        form.instance.recalculate_totals()
+
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
@@ -41,6 +50,20 @@ class CartItemAdmin(admin.ModelAdmin):
     search_fields = ('product__description',)
     search_help_text = 'Поиск по описанию товара'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.cart.recalculate_totals()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        obj.cart.recalculate_totals()
+
+    def delete_queryset(self, request, queryset):
+        carts = list(Cart.objects.filter(pk__in=queryset.values('cart')))
+        super().delete_queryset(request, queryset)
+        for cart in carts:
+            cart.recalculate_totals()
+
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -49,12 +72,34 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'full_name', 'status', 'total_amount', 'created_at')
+    list_display = ('id', 'user', 'full_name', 'status', 'total_amount', 'created_at')
     list_filter = ('status',)
     ordering = ('-created_at',)
-    search_fields = ('full_name', 'address', 'phone', 'cart__user__username')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('full_name', 'address', 'phone', 'user__username')
     search_help_text = 'Поиск по ФМО, почте, адресу, телефону или имени пользователя в Telegram'
     inlines = (OrderItemInline,)
+    actions = ('export_csv', 'export_jsonl')
+
+    def _export(self, queryset, fmt):
+        # ответ отдаётся по мере чтения курсора, выгрузка не собирается в памяти целиком;
+        # бэкенд работает под ASGI, где потоковый ответ должен быть асинхронным
+        response = StreamingHttpResponse(
+            astream_export(export_items(orders=queryset.values('id')), fmt),
+            content_type=CONTENT_TYPES[fmt],
+        )
+        filename = f'orders-{timezone.localdate().isoformat()}.{fmt}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description='Выгрузить выбранные заказы в CSV')
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description='Выгрузить выбранные заказы в JSON Lines')
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl')
 
 
 @admin.register(OrderItem)
@@ -0,0 +1,88 @@
+"""Потоковая выгрузка заказов для бухгалтерии (manage.py export_orders и действие в админке)"""
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import OrderItem
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+COLUMNS = (
+    'order_id', 'created_at', 'status', 'payment_id', 'total_amount',
+    'user_chat_id', 'user_username', 'full_name', 'phone', 'address',
+    'product_id', 'product_name', 'quantity', 'price', 'line_total',
+)
+# строк, которые курсор забирает из базы за один раз
+CHUNK_SIZE = 2000
+# строк выгрузки в одном куске ответа при асинхронной отдаче
+LINES_PER_CHUNK = 500
+
+
+def export_items(orders=None, since=None, until=None):
+    """Позиции заказов вместе с заказом, клиентом и товаром; since включительно, until — нет"""
+    items = OrderItem.objects.select_related('order__user', 'product')
+    if orders is not None:
+        items = items.filter(order__in=orders)
+    if since is not None:
+        items = items.filter(order__created_at__gte=since)
+    if until is not None:
+        items = items.filter(order__created_at__lt=until)
+    return items.order_by('order_id', 'id')
+
+
+def _row(item):
+    order = item.order
+    user = order.user
+    return (
+        order.id, order.created_at.isoformat(), order.status, order.payment_id, order.total_amount,
+        user.chat_id if user else None, user.username if user else None,
+        order.full_name, order.phone, order.address,
+        item.product_id, item.product.description, item.quantity, item.price, item.quantity * item.price,
+    )
+
+
+class _Echo:
+    """csv.writer пишет в него и получает строку обратно вместо записи в файл"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def stream_export(items, fmt='csv', chunk_size=CHUNK_SIZE):
+    """
+    Генератор строк выгрузки. На PostgreSQL .iterator() читает серверным курсором
+    по chunk_size строк, так что память не растёт с размером выгрузки.
+    """
+    rows = (_row(item) for item in items.iterator(chunk_size=chunk_size))
+    if fmt == 'jsonl':
+        return _jsonl_lines(rows)
+    return _csv_lines(rows)
+
+
+async def astream_export(items, fmt='csv', chunk_size=CHUNK_SIZE, lines_per_chunk=LINES_PER_CHUNK):
+    """
+    stream_export для ASGI. Синхронный итератор Django под ASGI собирает в список целиком,
+    поэтому строки забираются пачками в потоке sync_to_async и отдаются по мере готовности
+    """
+    lines = stream_export(items, fmt, chunk_size)
+    next_chunk = sync_to_async(lambda: ''.join(itertools.islice(lines, lines_per_chunk)))
+    while chunk := await next_chunk():
+        yield chunk
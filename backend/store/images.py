@@ -0,0 +1,81 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Параметры производного изображения, которое бот отправляет в Telegram
+TELEGRAM_IMAGE_MAX_SIDE = int(os.environ.get('TELEGRAM_IMAGE_MAX_SIDE', 1280))
+TELEGRAM_IMAGE_QUALITY = int(os.environ.get('TELEGRAM_IMAGE_QUALITY', 82))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='product-images')
+    return _executor
+
+
+def render_telegram_image(source) -> bytes:
+    """
+    Готовит изображение для Telegram: уменьшает по большей стороне,
+    сохраняет как progressive JPEG без EXIF.
+    """
+    # Pillow нужен только бэкенду, бот импортирует модели без него
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as original:
+        # ориентацию применяем до того, как EXIF будет отброшен
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((TELEGRAM_IMAGE_MAX_SIDE, TELEGRAM_IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=TELEGRAM_IMAGE_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def build_telegram_image(product_id: int, image_hash: str):
+    """Строит производное изображение товара и сохраняет его в Product.image_telegram"""
+    from .models import Product
+
+    product = Product.objects.filter(pk=product_id, image_hash=image_hash).first()
+    if product is None or not product.image:
+        # товар удалён или изображение успели заменить — актуальную задачу поставит следующее сохранение
+        return
+    with product.image.open('rb') as source:
+        data = render_telegram_image(source)
+    name = product.image_telegram.storage.save(
+        f'products/telegram/{product_id}_{image_hash[:16]}.jpg', ContentFile(data)
+    )
+    # file_id сбрасываем, чтобы бот загрузил в Telegram уже уменьшенную версию
+    Product.objects.filter(pk=product_id, image_hash=image_hash).update(image_telegram=name, image_file_id='')
+    logger.info(f'Изображение товара {product_id} для Telegram готово: {len(data)} байт')
+
+
+def _build_in_worker(product_id: int, image_hash: str):
+    close_old_connections()
+    try:
+        build_telegram_image(product_id, image_hash)
+    except Exception:
+        logger.exception(f'Не удалось подготовить изображение товара {product_id} для Telegram')
+    finally:
+        close_old_connections()
+
+
+def schedule_telegram_image(product):
+    """Ставит построение производного изображения в пул потоков после коммита транзакции"""
+    product_id, image_hash = product.pk, product.image_hash
+    transaction.on_commit(lambda: _get_executor().submit(_build_in_worker, product_id, image_hash))
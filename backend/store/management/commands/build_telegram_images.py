@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from store.images import build_telegram_image
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные изображения для Telegram у товаров, где их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Перестроить изображения у всех товаров')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='')
+        if not options['all']:
+            products = products.filter(image_telegram='')
+        built = 0
+        for product in products.only('id', 'image', 'image_hash').iterator():
+            if not product.image_hash:
+                product.image_hash = product._hash_image()
+                Product.objects.filter(pk=product.pk).update(image_hash=product.image_hash)
+            build_telegram_image(product.pk, product.image_hash)
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано товаров: {built}'))
@@ -0,0 +1,19 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from store.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Отменяет неоплаченные заказы старше TTL и снимает резерв с их товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=int(os.environ.get('RESERVATION_TTL', 30 * 60)),
+                            help='Время жизни неоплаченного заказа, секунд')
+        parser.add_argument('--batch-size', type=int, default=500, help='Заказов в одной транзакции')
+
+    def handle(self, *args, **options):
+        expired = Order.expire_pending(timedelta(seconds=options['ttl']), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Отменено заказов: {expired}'))
@@ -0,0 +1,47 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from store.exports import CHUNK_SIZE, FORMATS, export_items, stream_export
+
+
+def parse_moment(value):
+    """ГГГГ-ММ-ДД или ГГГГ-ММ-ДДTЧЧ:ММ[:СС] в aware datetime"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Выгружает заказы с позициями в CSV или JSON Lines потоково, без загрузки всех строк в память'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Начало периода (включительно), ГГГГ-ММ-ДД[TЧЧ:ММ]')
+        parser.add_argument('--until', help='Конец периода (не включая), ГГГГ-ММ-ДД[TЧЧ:ММ]')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='Формат выгрузки')
+        parser.add_argument('--output', '-o', help='Файл для записи; по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Строк за одно чтение курсора')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_moment(options['since']) if options['since'] else None
+            until = parse_moment(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(f'Неверная дата: {e}')
+
+        lines = stream_export(export_items(since=since, until=until), options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f'Выгрузка сохранена в {options["output"]}'))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сохранённые сумму и количество товаров корзин с их позициями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Пересчитать разошедшиеся корзины')
+
+    def handle(self, *args, **options):
+        drifted = Cart.drifted()
+        for cart in drifted.order_by('id')[:20]:
+            self.stdout.write(
+                f'Корзина #{cart.id}: {cart.item_count} шт. / {cart.total_amount} ₽, '
+                f'по позициям {cart.actual_count} шт. / {cart.actual_total} ₽'
+            )
+        count = drifted.count()
+        if not count:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+        elif options['fix']:
+            fixed = Cart.reconcile_totals()
+            self.stdout.write(self.style.SUCCESS(f'Исправлено корзин: {fixed}'))
+        else:
+            # ненулевой код выхода, чтобы расхождение заметил планировщик
+            raise CommandError(f'Корзин с расхождениями: {count}; запустите с --fix')
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_file_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Telegram file_id изображения'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Хэш изображения'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_image_hash_product_image_file_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_telegram',
+            field=models.ImageField(blank=True, editable=False, upload_to='products/telegram/', verbose_name='Изображение для Telegram'),
+        ),
+    ]
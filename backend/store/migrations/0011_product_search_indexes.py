@@ -0,0 +1,64 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:41
+
+import logging
+
+from django.db import DatabaseError, migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+# Индексы поиска есть только в PostgreSQL, поэтому их нет в Meta.indexes моделей:
+# на других СУБД store.search ищет через InMemoryProductSearch.
+FTS_INDEXES = [
+    ('product_description_fts', 'Product', "USING gin (to_tsvector('russian'::regconfig, COALESCE(description, '')))"),
+]
+TRIGRAM_INDEXES = [
+    ('product_description_trgm', 'Product', 'USING gin (description gin_trgm_ops)'),
+    ('faq_question_trgm', 'FAQ', 'USING gin (question gin_trgm_ops)'),
+]
+
+
+def _enable_trigram(schema_editor) -> bool:
+    """Включает pg_trgm; без прав на CREATE EXTENSION индексы триграмм не создаются"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone():
+            return True
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError as e:
+        logger.warning(f'Расширение pg_trgm не установлено ({e}), поиск с опечатками отключён')
+        return False
+    return True
+
+
+def _create(apps, schema_editor, indexes):
+    for name, model_name, definition in indexes:
+        table = apps.get_model('store', model_name)._meta.db_table
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}')
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    _create(apps, schema_editor, FTS_INDEXES)
+    if _enable_trigram(schema_editor):
+        _create(apps, schema_editor, TRIGRAM_INDEXES)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in FTS_INDEXES + TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_product_image_telegram'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
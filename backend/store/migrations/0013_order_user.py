@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_order_status_pending_order_status_created_idx'),
+        ('users', '0003_fsmrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='users.telegramuser', verbose_name='Клиент'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['user'], name='order_pending_user_idx'),
+        ),
+    ]
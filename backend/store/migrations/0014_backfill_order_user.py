@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:45
+
+from django.db import migrations, transaction
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def backfill_order_user(apps, schema_editor):
+    """Заполняет Order.user из корзины заказа пачками по диапазону id"""
+    Order = apps.get_model('store', 'Order')
+    Cart = apps.get_model('store', 'Cart')
+    cart_user = Subquery(Cart.objects.filter(pk=OuterRef('cart_id')).values('user_id')[:1])
+    last_id = Order.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        # каждая пачка — отдельная короткая транзакция
+        with transaction.atomic(using=schema_editor.connection.alias):
+            Order.objects.filter(
+                id__gte=start, id__lt=start + BATCH_SIZE, user__isnull=True
+            ).update(user_id=cart_user)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0013_order_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_user, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:49
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_backfill_order_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Товаров, шт.'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12, verbose_name='Сумма'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from decimal import Decimal
+
+from django.db import migrations, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def backfill_cart_totals(apps, schema_editor):
+    """Считает сумму и количество товаров существующих корзин пачками по диапазону id"""
+    Cart = apps.get_model('store', 'Cart')
+    CartItem = apps.get_model('store', 'CartItem')
+    money = models.DecimalField(max_digits=12, decimal_places=2)
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    total = items.annotate(total=Sum(F('quantity') * F('price'), output_field=money)).values('total')
+    count = items.annotate(count=Sum('quantity')).values('count')
+    last_id = Cart.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        # каждая пачка — отдельная короткая транзакция
+        with transaction.atomic(using=schema_editor.connection.alias):
+            Cart.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(
+                total_amount=Coalesce(Subquery(total), Value(Decimal('0')), output_field=money),
+                item_count=Coalesce(Subquery(count), Value(0)),
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0015_cart_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+from django.db import migrations, models, transaction
+from django.db.models import Count, F, Sum
+
+
+def merge_duplicate_open_carts(apps, schema_editor):
+    """
+    Оставляет у пользователя одну открытую корзину — с меньшим id, ту, что видел бот.
+    Позиции остальных переносятся в неё, сами корзины удаляются.
+    """
+    Cart = apps.get_model('store', 'Cart')
+    CartItem = apps.get_model('store', 'CartItem')
+    users = (
+        Cart.objects.filter(is_ordered=False, user__isnull=False)
+        .values('user').annotate(carts=Count('id')).filter(carts__gt=1).values_list('user', flat=True)
+    )
+    for user_id in users:
+        # каждый пользователь — отдельная короткая транзакция
+        with transaction.atomic(using=schema_editor.connection.alias):
+            _merge_user_carts(Cart, CartItem, user_id)
+
+
+def _merge_user_carts(Cart, CartItem, user_id):
+    kept, *extra = Cart.objects.filter(user_id=user_id, is_ordered=False).order_by('id')
+    for item in CartItem.objects.filter(cart__in=extra):
+        merged = CartItem.objects.filter(cart=kept, product_id=item.product_id).update(
+            quantity=F('quantity') + item.quantity
+        )
+        if merged:
+            item.delete()
+        else:
+            item.cart = kept
+            item.save(update_fields=['cart'])
+    Cart.objects.filter(pk__in=[cart.pk for cart in extra]).delete()
+    totals = CartItem.objects.filter(cart=kept).aggregate(
+        total=Sum(F('quantity') * F('price'), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        count=Sum('quantity'),
+    )
+    Cart.objects.filter(pk=kept.pk).update(total_amount=totals['total'] or Decimal('0'),
+                                           item_count=totals['count'] or 0)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0016_backfill_cart_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_open_carts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_merge_duplicate_open_carts'),
+        ('users', '0003_fsmrecord'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_ordered', False)), fields=('user',), name='cart_one_open_per_user'),
+        ),
+    ]
@@ -1,10 +1,17 @@
+import hashlib
+from datetime import timedelta
 from decimal import Decimal
 
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connection, models
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 
 from users.models import TelegramUser
+from .images import schedule_telegram_image
 
 
 class Category(models.Model):
@@ -42,15 +49,40 @@ class Product(models.Model):
     quantity = models.PositiveIntegerField(default=0, verbose_name='Количество')
     reserved = models.PositiveIntegerField(default=0, verbose_name='Зарезервировано')
     in_stock = models.BooleanField(default=False, verbose_name='В наличии')
+    image_hash = models.CharField(max_length=64, blank=True, editable=False, verbose_name='Хэш изображения')
+    image_file_id = models.CharField(max_length=255, blank=True, editable=False,
+                                     verbose_name='Telegram file_id изображения')
+    image_telegram = models.ImageField(upload_to='products/telegram/', blank=True, editable=False,
+                                       verbose_name='Изображение для Telegram')
 
     def save(self, *args, **kwargs):
         self.in_stock = self.quantity > 0
+        # новое изображение — сохранённые file_id и уменьшенная копия больше не подходят
+        image_uploaded = bool(self.image) and not self.image._committed
+        if image_uploaded:
+            self.image_hash = self._hash_image()
+            self.image_file_id = ''
+            self.image_telegram = ''
+        elif not self.image and self.image_hash:
+            self.image_hash = ''
+            self.image_file_id = ''
+            self.image_telegram = ''
         super().save(*args, **kwargs)
+        if image_uploaded:
+            schedule_telegram_image(self)
+
+    def _hash_image(self) -> str:
+        digest = hashlib.sha256()
+        for chunk in self.image.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
 
     class Meta:
         ordering = ['id']
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
+        # GIN-индексы полнотекстового поиска и pg_trgm создаёт только на PostgreSQL
+        # миграция 0011_product_search_indexes, см. store.search
 
     def __str__(self):
         return self.description
@@ -61,14 +93,161 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     is_ordered = models.BooleanField(default=False, verbose_name='Заказ создан')
+    # поддерживаются ботом при каждом изменении корзины, чтобы не суммировать позиции
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'),
+                                       verbose_name='Сумма')
+    item_count = models.PositiveIntegerField(default=0, verbose_name='Товаров, шт.')
 
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+        constraints = [
+            # одновременные первые добавления в корзину не создадут пользователю вторую открытую
+            models.UniqueConstraint(fields=['user'], condition=Q(is_ordered=False), name='cart_one_open_per_user'),
+        ]
 
     def __str__(self):
         return f'Cart {self.id}' if self.user is None else f'Cart of {self.user}'
 
+    @classmethod
+    def ensure_open(cls, user: TelegramUser):
+        """
+        Создаёт пользователю открытую корзину, если её нет, одним INSERT ... ON CONFLICT DO NOTHING:
+        при одновременных вызовах вставка второго упирается в cart_one_open_per_user и пропускается.
+        """
+        cls.objects.bulk_create([cls(user=user)], ignore_conflicts=True)
+
+    @staticmethod
+    def _actual_totals():
+        """Сумма и количество, посчитанные по позициям корзины"""
+        items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        total = items.annotate(
+            total=Sum(F('quantity') * F('price'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        ).values('total')
+        count = items.annotate(count=Sum('quantity')).values('count')
+        return {
+            'actual_total': Coalesce(Subquery(total), Value(Decimal('0')),
+                                     output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            'actual_count': Coalesce(Subquery(count), Value(0)),
+        }
+
+    def recalculate_totals(self):
+        """Пересчитывает сумму и количество по позициям; для правок мимо бота (админка)"""
+        totals = self._actual_totals()
+        Cart.objects.filter(pk=self.pk).update(total_amount=totals['actual_total'], item_count=totals['actual_count'])
+        self.refresh_from_db(fields=['total_amount', 'item_count'])
+
+    @classmethod
+    def drifted(cls):
+        """Корзины, у которых сохранённые итоги разошлись с позициями"""
+        return cls.objects.annotate(**cls._actual_totals()).exclude(
+            total_amount=F('actual_total'), item_count=F('actual_count')
+        )
+
+    @classmethod
+    def reconcile_totals(cls) -> int:
+        """Исправляет разошедшиеся итоги корзин, возвращает их число"""
+        totals = cls._actual_totals()
+        return cls.objects.filter(pk__in=cls.drifted().values('pk')).update(total_amount=totals['actual_total'], item_count=totals['actual_count'])
+
+    def refresh_prices(self) -> int:
+        """
+        Переносит в позиции текущие цены товаров и пересчитывает итоги. Цена позиции
+        запоминается при первом добавлении, а счёт выставляется по текущей цене.
+        Возвращает число позиций, у которых цена изменилась.
+        """
+        with transaction.atomic():
+            changed = CartItem.objects.filter(cart=self).exclude(price=F('product__price')).update(
+                price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+            )
+            if changed:
+                self.recalculate_totals()
+        return changed
+
+    @classmethod
+    def add_item(cls, chat_id: int, product_id: int, quantity: int) -> bool:
+        """
+        Одним запросом находит открытую корзину пользователя и добавляет в неё товар;
+        при повторном добавлении увеличивает количество (ON CONFLICT по unique_together).
+        В том же запросе прибавляет позицию к сумме и количеству товаров корзины.
+        Возвращает False, если корзины или товара нет.
+        """
+        cart_table = cls._meta.db_table
+        item_table = CartItem._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                WITH item AS (
+                    INSERT INTO {item_table} (cart_id, product_id, quantity, price)
+                    SELECT c.id, p.id, %s, p.price
+                    FROM {cart_table} c
+                    JOIN {TelegramUser._meta.db_table} u ON u.id = c.user_id
+                    JOIN {Product._meta.db_table} p ON p.id = %s
+                    WHERE u.chat_id = %s AND NOT c.is_ordered
+                    ON CONFLICT (cart_id, product_id)
+                    DO UPDATE SET quantity = {item_table}.quantity + EXCLUDED.quantity
+                    RETURNING cart_id, price
+                )
+                UPDATE {cart_table}
+                SET total_amount = total_amount + %s * item.price,
+                    item_count = item_count + %s,
+                    updated_at = now()
+                FROM item
+                WHERE {cart_table}.id = item.cart_id
+                ''',
+                [quantity, product_id, chat_id, quantity, quantity]
+            )
+            return cursor.rowcount > 0
+
+    @classmethod
+    def remove_item(cls, chat_id: int, item_id: int) -> bool:
+        """Удаляет позицию из открытой корзины и вычитает её из итогов корзины одним запросом"""
+        cart_table = cls._meta.db_table
+        item_table = CartItem._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                WITH item AS (
+                    DELETE FROM {item_table} i
+                    USING {cart_table} c, {TelegramUser._meta.db_table} u
+                    WHERE i.id = %s AND c.id = i.cart_id AND u.id = c.user_id
+                      AND u.chat_id = %s AND NOT c.is_ordered
+                    RETURNING i.cart_id, i.quantity, i.price
+                )
+                UPDATE {cart_table}
+                SET total_amount = total_amount - item.quantity * item.price,
+                    item_count = item_count - item.quantity,
+                    updated_at = now()
+                FROM item
+                WHERE {cart_table}.id = item.cart_id
+                ''',
+                [item_id, chat_id]
+            )
+            return cursor.rowcount > 0
+
+    @classmethod
+    def clear_open(cls, chat_id: int):
+        """Удаляет все позиции открытой корзины и обнуляет её итоги одним запросом"""
+        cart_table = cls._meta.db_table
+        item_table = CartItem._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                WITH cart AS (
+                    SELECT c.id
+                    FROM {cart_table} c
+                    JOIN {TelegramUser._meta.db_table} u ON u.id = c.user_id
+                    WHERE u.chat_id = %s AND NOT c.is_ordered
+                ), removed AS (
+                    DELETE FROM {item_table} WHERE cart_id IN (SELECT id FROM cart)
+                )
+                UPDATE {cart_table}
+                SET total_amount = 0, item_count = 0, updated_at = now()
+                WHERE id IN (SELECT id FROM cart)
+                ''',
+                [chat_id]
+            )
+
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items', verbose_name='Корзина')
@@ -88,6 +267,9 @@ class CartItem(models.Model):
 
 class Order(models.Model):
     cart = models.OneToOneField(Cart, on_delete=models.PROTECT, related_name='order', verbose_name='Корзина')
+    # дублирует cart.user, чтобы искать заказы пользователя без JOIN через корзину
+    user = models.ForeignKey(TelegramUser, null=True, blank=True, on_delete=models.PROTECT, related_name='orders',
+                             verbose_name='Клиент')
     full_name = models.CharField(max_length=255, verbose_name='Полное имя')
     phone = models.CharField(max_length=20, verbose_name='Телефон')
     address = models.TextField(max_length=200, verbose_name='Адрес')
@@ -97,7 +279,8 @@ class Order(models.Model):
     payment_id = models.CharField(max_length=255, null=True, blank=True, verbose_name='ID платежа')
     status = models.CharField(
         max_length=20,
-        choices=[('new', 'New'), ('paid', 'Paid'), ('shipped', 'Shipped'), ('cancelled', 'Cancelled')],
+        choices=[('new', 'New'), ('pending', 'Pending'), ('paid', 'Paid'), ('shipped', 'Shipped'),
+                 ('cancelled', 'Cancelled')],
         default='new',
         verbose_name='Статус'
     )
@@ -105,10 +288,109 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            # поиск просроченных неоплаченных заказов, см. Order.expire_pending
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # активный заказ пользователя при оформлении
+            models.Index(fields=['user'], condition=models.Q(status='pending'), name='order_pending_user_idx'),
+        ]
 
-    @property
-    def user(self):
-        return self.cart.user
+    def save(self, *args, **kwargs):
+        if self.user_id is None and self.cart_id is not None:
+            self.user_id = Cart.objects.filter(pk=self.cart_id).values_list('user_id', flat=True).first()
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def _ordered_quantity(order_ids) -> Subquery:
+        """Количество товара в заказах order_ids — для UPDATE по их товарам"""
+        return Subquery(
+            OrderItem.objects.filter(order_id__in=order_ids, product=OuterRef('pk'))
+            .values('product')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+
+    @classmethod
+    def _release_reserved(cls, order_ids):
+        Product.objects.filter(orderitem__order_id__in=order_ids).update(
+            reserved=Greatest(F('reserved') - cls._ordered_quantity(order_ids), Value(0)),
+        )
+
+    def confirm_stock(self, payment_id: str | None = None) -> bool:
+        """
+        Переводит заказ из pending в paid и списывает его товары со склада и из резерва.
+        Смена статуса и списание — в одной транзакции: UPDATE блокирует строку заказа, поэтому
+        повторное подтверждение той же оплаты ничего не списывает.
+        Возвращает False, если заказ уже не pending (оплачен или отменён).
+        """
+        ordered = self._ordered_quantity([self.pk])
+        with transaction.atomic():
+            if not Order.objects.filter(pk=self.pk, status='pending').update(status='paid', payment_id=payment_id):
+                return False
+            Product.objects.filter(orderitem__order=self).update(
+                quantity=F('quantity') - ordered,
+                reserved=Greatest(F('reserved') - ordered, Value(0)),
+                in_stock=Case(When(quantity__gt=ordered, then=Value(True)), default=Value(False)),
+            )
+            # update() не отправляет сигналы — если товар закончился, сбрасываем кэш каталога сами
+            if Product.objects.filter(orderitem__order=self, in_stock=False).exists():
+                CatalogVersion.bump()
+        self.status, self.payment_id = 'paid', payment_id
+        return True
+
+    def release_reservation(self):
+        """Снимает резерв с товаров заказа одним UPDATE"""
+        self._release_reserved([self.pk])
+
+    def cancel(self) -> bool:
+        """
+        Отменяет ожидающий оплаты заказ и снимает его резерв. Как и в confirm_stock, статус
+        меняется условным UPDATE: резерв оплаченного или уже отменённого (например, сборщиком
+        просроченных) заказа второй раз не снимается. False, если заказ уже не pending.
+        """
+        with transaction.atomic():
+            if not Order.objects.filter(pk=self.pk, status='pending').update(status='cancelled'):
+                return False
+            self.release_reservation()
+        self.status = 'cancelled'
+        return True
+
+    def prolong_reservation(self, **fields) -> bool:
+        """
+        Отсчитывает срок резерва ожидающего оплаты заказа заново, чтобы сборщик просроченных
+        не отменил заказ, пока идёт оплата; заодно сохраняет fields. Условный UPDATE ждёт
+        сборщика, если тот уже взял заказ. False, если заказ уже не pending.
+        """
+        now = timezone.now()
+        if not Order.objects.filter(pk=self.pk, status='pending').update(created_at=now, **fields):
+            return False
+        self.created_at = now
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
+    @classmethod
+    def expire_pending(cls, older_than: timedelta, batch_size: int = 500) -> int:
+        """
+        Отменяет неоплаченные заказы старше older_than и снимает их резерв.
+        Работает пачками; заблокированные другим процессом заказы пропускает.
+        Возвращает количество отменённых заказов.
+        """
+        cutoff = timezone.now() - older_than
+        expired = 0
+        while True:
+            with transaction.atomic():
+                order_ids = list(
+                    cls.objects.select_for_update(skip_locked=True)
+                    .filter(status='pending', created_at__lt=cutoff)
+                    .order_by('created_at')
+                    .values_list('id', flat=True)[:batch_size]
+                )
+                if not order_ids:
+                    return expired
+                cls._release_reserved(order_ids)
+                cls.objects.filter(id__in=order_ids).update(status='cancelled')
+            expired += len(order_ids)
 
     def __str__(self):
         return f'Order {self.id} - {self.status}'
@@ -136,6 +418,26 @@ class FAQ(models.Model):
     class Meta:
         verbose_name = 'Часто задаваемый вопрос'
         verbose_name_plural = 'Часто задаваемые вопросы'
+        # question__icontains в inline-поиске по FAQ ускоряет GIN-индекс pg_trgm
+        # из миграции 0011_product_search_indexes (только PostgreSQL)
 
     def __str__(self):
         return self.question[:20]
+
+
+class CatalogVersion(models.Model):
+    version = models.PositiveBigIntegerField(default=0, verbose_name='Версия')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Версия каталога'
+        verbose_name_plural = 'Версии каталога'
+
+    @classmethod
+    def bump(cls):
+        """Увеличивает глобальную версию каталога, по которой бот сбрасывает свой кэш"""
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1, updated_at=timezone.now()):
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+
+    def __str__(self):
+        return f'Catalog v{self.version}'
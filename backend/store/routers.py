@@ -0,0 +1,69 @@
+"""
+Чтение каталога с реплик (DATABASE_REPLICAS, см. TelegramStore/settings.py).
+
+На реплики уходят только чтения Category, Product, FAQ и CatalogVersion и только внутри
+use_replicas() — его включает бот на время обработки обновления. Админка, API, фоновые
+задачи, корзины и заказы работают с основной базой.
+
+Чтения в транзакции основной базы (select_for_update при резерве товара) остаются на ней.
+После первой записи через ORM в рамках use_replicas() все чтения до конца обновления идут
+в основную базу: пользователь видит то, что только что записал, а не отставшую реплику.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_MODELS = frozenset({'store.Category', 'store.Product', 'store.FAQ', 'store.CatalogVersion'})
+
+
+@dataclass
+class RoutingState:
+    # одна реплика на всё обновление: версия каталога и данные читаются с одного сервера
+    replica: str | None = None
+    pinned: bool = False
+
+
+# sync_to_async копирует контекст в поток вместе с объектом состояния,
+# поэтому запись в потоке закрепляет и чтения в event loop
+routing_state: ContextVar[RoutingState | None] = ContextVar('routing_state', default=None)
+
+
+@contextmanager
+def use_replicas():
+    token = routing_state.set(RoutingState())
+    try:
+        yield
+    finally:
+        routing_state.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        state = routing_state.get()
+        replicas = settings.DATABASE_REPLICAS
+        if (state is None or state.pinned or not replicas or model._meta.label not in REPLICA_MODELS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # реплики получают схему и данные репликацией
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,115 @@
+import re
+from functools import cache
+from typing import Iterable
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+SEARCH_CONFIG = 'russian'
+# Минимальная похожесть слова (по триграммам), при которой считаем его опечаткой
+FUZZY_THRESHOLD = 0.4
+
+_WORD_RE = re.compile(r'\w+')
+
+
+class PostgresProductSearch:
+    """
+    Поиск товаров по описанию: полнотекстовый (tsvector, стемминг) плюс триграммы pg_trgm
+    для опечаток. Оба условия обслуживаются GIN-индексами из миграции 0011_product_search_indexes.
+    Без расширения pg_trgm (fuzzy=False) остаётся только полнотекстовый поиск.
+    """
+
+    def __init__(self, fuzzy: bool = True):
+        self.fuzzy = fuzzy
+
+    def search(self, query: str, limit: int = 10) -> list[Product]:
+        query = query.strip()
+        if not query:
+            return []
+        vector = SearchVector('description', config=SEARCH_CONFIG)
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        products = Product.objects.annotate(document=vector, rank=SearchRank(vector, search_query))
+        if not self.fuzzy:
+            return list(products.filter(document=search_query).order_by('-rank', 'id')[:limit])
+        return list(
+            products.annotate(similarity=TrigramWordSimilarity(query, 'description'))
+            .filter(Q(document=search_query) | Q(description__trigram_word_similar=query))
+            .order_by('-rank', '-similarity', 'id')[:limit]
+        )
+
+
+def _trigrams(word: str) -> set[str]:
+    # как в pg_trgm: слово дополняется двумя пробелами в начале и одним в конце
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class InMemoryProductSearch:
+    """
+    Индекс в памяти с тем же интерфейсом, что и PostgresProductSearch. Нужен там,
+    где нет Postgres и расширения pg_trgm (тесты, SQLite).
+    """
+
+    def __init__(self, products: Iterable[Product]):
+        self._products: dict[int, Product] = {}
+        self._words: dict[str, set[int]] = {}
+        self._word_trigrams: dict[str, set[str]] = {}
+        for product in products:
+            self._products[product.id] = product
+            for word in _WORD_RE.findall(product.description.lower()):
+                self._words.setdefault(word, set()).add(product.id)
+                self._word_trigrams.setdefault(word, _trigrams(word))
+
+    def _match_word(self, term: str) -> dict[int, float]:
+        """Оценка каждого товара по одному слову запроса: точное совпадение, префикс или опечатка"""
+        term_trigrams = _trigrams(term)
+        scores: dict[int, float] = {}
+        for word, product_ids in self._words.items():
+            if word == term:
+                score = 1.0
+            elif word.startswith(term):
+                score = 0.9
+            else:
+                score = _similarity(term_trigrams, self._word_trigrams[word])
+                if score < FUZZY_THRESHOLD:
+                    continue
+            for product_id in product_ids:
+                scores[product_id] = max(scores.get(product_id, 0.0), score)
+        return scores
+
+    def search(self, query: str, limit: int = 10) -> list[Product]:
+        terms = _WORD_RE.findall(query.lower())
+        if not terms:
+            return []
+        totals: dict[int, float] | None = None
+        for term in terms:
+            scores = self._match_word(term)
+            if totals is None:
+                totals = scores
+            else:
+                # товар должен подходить под каждое слово запроса
+                totals = {pid: totals[pid] + score for pid, score in scores.items() if pid in totals}
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+        return [self._products[product_id] for product_id, _ in ranked[:limit]]
+
+
+@cache
+def _has_trigram() -> bool:
+    """Установлено ли pg_trgm (миграция 0011 ставит его, только если хватает прав)"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def search_products(query: str, limit: int = 10) -> list[Product]:
+    """Ищет товары средствами Postgres, а на других СУБД — через индекс в памяти"""
+    if connection.vendor == 'postgresql':
+        return PostgresProductSearch(fuzzy=_has_trigram()).search(query, limit)
+    return InMemoryProductSearch(Product.objects.all()).search(query, limit)
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import FAQ, CatalogVersion, Category, Product
+
+# Поля, изменение которых не видно в каталоге (резерв меняется при каждом оформлении заказа)
+NON_CATALOG_FIELDS = frozenset({'reserved'})
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=FAQ)
+def bump_catalog_version_on_save(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= NON_CATALOG_FIELDS:
+        return
+    CatalogVersion.bump()
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=FAQ)
+def bump_catalog_version_on_delete(sender, **kwargs):
+    CatalogVersion.bump()
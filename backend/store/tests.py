@@ -1,3 +1,373 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from threading import Barrier
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+
+from users.models import TelegramUser
+from .exports import COLUMNS, astream_export, export_items, stream_export
+from .models import Cart, CartItem, Category, Order, OrderItem, Product
+from .routers import ReplicaRouter, use_replicas
+from .search import InMemoryProductSearch
+
+
+class InMemoryProductSearchTests(SimpleTestCase):
+    def setUp(self):
+        self.products = [
+            Product(id=1, description='Смартфон Samsung Galaxy черный', price=Decimal('100.00')),
+            Product(id=2, description='Чехол для смартфона', price=Decimal('10.00')),
+            Product(id=3, description='Ноутбук Lenovo ThinkPad', price=Decimal('500.00')),
+            Product(id=4, description='Наушники Samsung Buds', price=Decimal('50.00')),
+        ]
+        self.index = InMemoryProductSearch(self.products)
+
+    def ids(self, query, limit=10):
+        return [p.id for p in self.index.search(query, limit)]
+
+    def test_exact_word(self):
+        self.assertEqual(self.ids('ноутбук'), [3])
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.ids('samsung galaxy'), [1])
+
+    def test_prefix(self):
+        self.assertEqual(self.ids('смартф'), [1, 2])
+
+    def test_typo(self):
+        self.assertEqual(self.ids('ноутбок'), [3])
+
+    def test_exact_match_ranks_first(self):
+        self.assertEqual(self.ids('смартфон'), [1, 2])
+
+    def test_limit(self):
+        self.assertEqual(self.ids('samsung', limit=1), [1])
+
+    def test_empty_query(self):
+        self.assertEqual(self.ids('  '), [])
+        self.assertEqual(self.ids('несуществующий'), [])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class OrderStockSettlementConcurrencyTests(TransactionTestCase):
+    """Одновременные оплаты одного товара не должны терять обновления остатка"""
+    orders_count = 20
+
+    def setUp(self):
+        category = Category.objects.create(name='Категория')
+        self.product = Product.objects.create(category=category, description='Товар', price=Decimal('10.00'),
+                                              quantity=self.orders_count * 2, reserved=self.orders_count * 2)
+        self.orders = []
+        for i in range(self.orders_count):
+            user = TelegramUser.objects.create(chat_id=i + 1)
+            order = Order.objects.create(cart=Cart.objects.create(user=user), total_amount=Decimal('20.00'),
+                                         status='pending')
+            OrderItem.objects.create(order=order, product=self.product, quantity=2, price=Decimal('10.00'))
+            self.orders.append(order)
+
+    def _run_concurrently(self, action):
+        barrier = Barrier(len(self.orders))
+
+        def run(order):
+            try:
+                barrier.wait()
+                action(order)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(self.orders)) as pool:
+            list(pool.map(run, self.orders))
+
+    def test_concurrent_confirmations(self):
+        self._run_concurrently(Order.confirm_stock)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(self.product.reserved, 0)
+        self.assertFalse(self.product.in_stock)
+        self.assertEqual(Order.objects.filter(status='paid').count(), self.orders_count)
+
+    def test_repeated_confirmation_is_noop(self):
+        order = self.orders[0]
+        self.assertTrue(order.confirm_stock('charge-1'))
+        # Telegram может доставить successful_payment повторно
+        self.assertFalse(Order.objects.get(pk=order.pk).confirm_stock('charge-1'))
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity, self.product.reserved),
+                         (self.orders_count * 2 - 2, self.orders_count * 2 - 2))
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_id), ('paid', 'charge-1'))
+
+    def test_payment_after_sweep_is_rejected(self):
+        order = self.orders[0]
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(Order.expire_pending(timedelta(minutes=30)), 1)
+
+        self.assertFalse(order.confirm_stock('charge-1'))
+        self.assertFalse(order.cancel())
+
+        self.product.refresh_from_db()
+        # резерв снят один раз, со склада ничего не списано
+        self.assertEqual((self.product.quantity, self.product.reserved),
+                         (self.orders_count * 2, self.orders_count * 2 - 2))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'cancelled')
+
+    def test_sweep_after_pre_checkout_keeps_order(self):
+        order = self.orders[0]
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+        # pre_checkout одобрил оплату — сборщик заказ уже не трогает
+        self.assertTrue(order.prolong_reservation(full_name='Иванов Иван'))
+        self.assertEqual(Order.expire_pending(timedelta(minutes=30)), 0)
+        self.assertTrue(order.confirm_stock('charge-1'))
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.full_name), ('paid', 'Иванов Иван'))
+
+    def test_pre_checkout_after_sweep_is_rejected(self):
+        order = self.orders[0]
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        Order.expire_pending(timedelta(minutes=30))
+
+        self.assertFalse(order.prolong_reservation(full_name='Иванов Иван'))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'cancelled')
+
+    def test_sweep_races_payment(self):
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        barrier = Barrier(2)
+        confirmed = []
+
+        def pay():
+            try:
+                barrier.wait()
+                confirmed.extend(order.confirm_stock() for order in self.orders)
+            finally:
+                connection.close()
+
+        def sweep():
+            try:
+                barrier.wait()
+                Order.expire_pending(timedelta(minutes=30), batch_size=1)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            for future in [pool.submit(pay), pool.submit(sweep)]:
+                future.result()
+
+        # каждый заказ либо оплачен, либо отменён, и резерв снят ровно один раз
+        paid = confirmed.count(True)
+        self.assertEqual(Order.objects.filter(status='paid').count(), paid)
+        self.assertEqual(Order.objects.filter(status='cancelled').count(), self.orders_count - paid)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity, self.product.reserved), (self.orders_count * 2 - paid * 2, 0))
+
+    def test_concurrent_releases(self):
+        self._run_concurrently(Order.release_reservation)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, self.orders_count * 2)
+        self.assertEqual(self.product.reserved, 0)
+        self.assertTrue(self.product.in_stock)
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Категория')
+        product = Product.objects.create(category=category, description='Товар, "в кавычках"',
+                                         price=Decimal('10.00'), quantity=10)
+        self.orders = []
+        for i in range(3):
+            user = TelegramUser.objects.create(chat_id=i + 1, username=f'user{i}')
+            order = Order.objects.create(cart=Cart.objects.create(user=user), total_amount=Decimal('20.00'),
+                                         full_name='Иванов Иван', status='paid')
+            OrderItem.objects.create(order=order, product=product, quantity=2, price=Decimal('10.00'))
+            self.orders.append(order)
+        # created_at выставляется auto_now_add, сдвигаем первый заказ в прошлое
+        Order.objects.filter(pk=self.orders[0].pk).update(created_at=timezone.now() - timedelta(days=10))
+
+    def test_csv_roundtrip(self):
+        lines = list(stream_export(export_items(), 'csv', chunk_size=1))
+        rows = list(csv.reader(io.StringIO(''.join(lines))))
+        self.assertEqual(tuple(rows[0]), COLUMNS)
+        self.assertEqual([int(row[0]) for row in rows[1:]], [order.id for order in self.orders])
+        self.assertEqual(rows[1][COLUMNS.index('product_name')], 'Товар, "в кавычках"')
+        self.assertEqual(rows[1][COLUMNS.index('line_total')], '20.00')
+
+    def test_jsonl_period(self):
+        since = timezone.now() - timedelta(days=1)
+        lines = list(stream_export(export_items(since=since), 'jsonl'))
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([r['order_id'] for r in records], [order.id for order in self.orders[1:]])
+        self.assertEqual(records[0]['user_username'], 'user1')
+
+    def test_selected_orders(self):
+        items = export_items(orders=Order.objects.filter(pk=self.orders[2].pk).values('id'))
+        self.assertEqual([item.order_id for item in items], [self.orders[2].id])
+
+    async def test_admin_action_streams_under_asgi(self):
+        admin = await User.objects.acreate(username='admin', is_staff=True, is_superuser=True)
+        await self.async_client.aforce_login(admin)
+        with mock.patch('store.admin.astream_export', partial(astream_export, lines_per_chunk=1)):
+            response = await self.async_client.post('/admin/store/order/', {
+                'action': 'export_csv', '_selected_action': [order.pk for order in self.orders],
+            })
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        # заголовок и по строке на заказ — отдельными кусками, а не одним списком
+        self.assertEqual(len(chunks), 4)
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [order.id for order in self.orders])
+
+
+class CartTotalsReconciliationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Категория')
+        self.product = Product.objects.create(category=category, description='Товар', price=Decimal('10.00'),
+                                              quantity=10)
+        self.cart = Cart.objects.create(user=TelegramUser.objects.create(chat_id=1))
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=3, price=Decimal('10.00'))
+
+    def test_detects_and_fixes_drift(self):
+        self.assertEqual(list(Cart.drifted()), [self.cart])
+
+        self.assertEqual(Cart.reconcile_totals(), 1)
+
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_amount, Decimal('30.00'))
+        self.assertEqual(self.cart.item_count, 3)
+        self.assertFalse(Cart.drifted().exists())
+
+    def test_empty_cart_is_consistent(self):
+        empty = Cart.objects.create(user=TelegramUser.objects.create(chat_id=2))
+        self.assertNotIn(empty, Cart.drifted())
+
+    def test_recalculate_totals(self):
+        self.cart.recalculate_totals()
+        self.assertEqual((self.cart.total_amount, self.cart.item_count), (Decimal('30.00'), 3))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class OpenCartConcurrencyTests(TransactionTestCase):
+    """Одновременные первые добавления в корзину не должны создавать вторую открытую корзину"""
+
+    def test_concurrent_ensure_open(self):
+        user = TelegramUser.objects.create(chat_id=1)
+        barrier = Barrier(10)
+
+        def run(_):
+            try:
+                barrier.wait()
+                Cart.ensure_open(user)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            list(pool.map(run, range(10)))
+
+        self.assertEqual(Cart.objects.filter(user=user, is_ordered=False).count(), 1)
+
+
+class OpenCartConstraintTests(TestCase):
+    """Ограничение cart_one_open_per_user касается только открытых корзин"""
+
+    def test_ordered_carts_are_not_limited(self):
+        user = TelegramUser.objects.create(chat_id=1)
+        Cart.objects.create(user=user, is_ordered=True)
+        Cart.objects.create(user=user, is_ordered=True)
+        Cart.ensure_open(user)
+        Cart.ensure_open(user)
+
+        self.assertEqual(Cart.objects.filter(user=user, is_ordered=False).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(user=user)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'запросы корзины используют CTE с INSERT/DELETE')
+class CartItemsSqlTests(TestCase):
+    """Запросы бота, которые меняют позиции корзины и её итоги одним SQL"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Категория')
+        self.cheap = Product.objects.create(category=category, description='Дешёвый', price=Decimal('10.00'),
+                                            quantity=10)
+        self.dear = Product.objects.create(category=category, description='Дорогой', price=Decimal('25.50'),
+                                           quantity=10)
+        self.cart = Cart.objects.create(user=TelegramUser.objects.create(chat_id=7))
+
+    def totals(self):
+        self.cart.refresh_from_db()
+        self.assertFalse(Cart.drifted().exists())
+        return self.cart.total_amount, self.cart.item_count
+
+    def test_add_item(self):
+        self.assertTrue(Cart.add_item(7, self.cheap.pk, 2))
+        self.assertTrue(Cart.add_item(7, self.dear.pk, 1))
+        self.assertTrue(Cart.add_item(7, self.cheap.pk, 3))
+
+        self.assertEqual(CartItem.objects.get(cart=self.cart, product=self.cheap).quantity, 5)
+        self.assertEqual(self.totals(), (Decimal('75.50'), 6))
+
+    def test_add_item_without_cart_or_product(self):
+        self.assertFalse(Cart.add_item(8, self.cheap.pk, 1))
+        self.assertFalse(Cart.add_item(7, 0, 1))
+        self.assertEqual(self.totals(), (Decimal('0'), 0))
+
+    def test_remove_item(self):
+        Cart.add_item(7, self.cheap.pk, 2)
+        Cart.add_item(7, self.dear.pk, 2)
+        item = CartItem.objects.get(cart=self.cart, product=self.dear)
+
+        self.assertFalse(Cart.remove_item(8, item.pk))
+        self.assertTrue(Cart.remove_item(7, item.pk))
+        self.assertEqual(self.totals(), (Decimal('20.00'), 2))
+
+    def test_clear_open(self):
+        Cart.add_item(7, self.cheap.pk, 2)
+        Cart.add_item(7, self.dear.pk, 1)
+
+        Cart.clear_open(7)
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        self.assertEqual(self.totals(), (Decimal('0'), 0))
+
+    def test_refresh_prices(self):
+        Cart.add_item(7, self.cheap.pk, 2)
+        Cart.add_item(7, self.dear.pk, 1)
+        Product.objects.filter(pk=self.cheap.pk).update(price=Decimal('12.00'))
+
+        self.assertEqual(self.cart.refresh_prices(), 1)
+        self.assertEqual(CartItem.objects.get(cart=self.cart, product=self.cheap).price, Decimal('12.00'))
+        self.assertEqual(self.totals(), (Decimal('49.50'), 3))
+        self.assertEqual(self.cart.refresh_prices(), 0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRouterTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def test_catalog_reads_go_to_replica_only_inside_update(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        with use_replicas():
+            self.assertEqual(self.router.db_for_read(Product), 'replica_0')
+            self.assertEqual(self.router.db_for_read(Cart), 'default')
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_write_pins_reads_to_primary(self):
+        with use_replicas():
+            self.assertEqual(self.router.db_for_write(Order), 'default')
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        with use_replicas():
+            self.assertEqual(self.router.db_for_read(Product), 'replica_0')
+
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica_0', 'store'))
+        self.assertTrue(self.router.allow_migrate('default', 'store'))
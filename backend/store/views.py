@@ -0,0 +1,12 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import JsonResponse
+
+
+@staff_member_required
+def db_pool_stats(request):
+    """Загрузка пула соединений этого процесса (при DB_POOL=1)"""
+    pool = connections['default'].pool
+    if pool is None:
+        return JsonResponse({'pool': False})
+    return JsonResponse({'pool': True, **pool.get_stats()})
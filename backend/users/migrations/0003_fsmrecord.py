@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_telegramuser_first_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FSMRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Ключ')),
+                ('state', models.CharField(blank=True, max_length=255, null=True, verbose_name='Состояние')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='Данные')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Истекает')),
+            ],
+            options={
+                'verbose_name': 'Состояние диалога',
+                'verbose_name_plural': 'Состояния диалогов',
+            },
+        ),
+    ]
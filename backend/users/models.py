@@ -14,3 +14,18 @@ class TelegramUser(models.Model):
 
     def __str__(self):
         return self.username or str(self.chat_id)
+
+
+class FSMRecord(models.Model):
+    """Состояние диалога бота (aiogram FSM) для хранилища в Postgres"""
+    key = models.CharField(max_length=255, unique=True, verbose_name='Ключ')
+    state = models.CharField(max_length=255, null=True, blank=True, verbose_name='Состояние')
+    data = models.JSONField(default=dict, blank=True, verbose_name='Данные')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Истекает')
+
+    class Meta:
+        verbose_name = 'Состояние диалога'
+        verbose_name_plural = 'Состояния диалогов'
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,128 @@
+"""
+Запросы каталога по отдельности: OrmCatalogReader (ORM через sync_to_async) против
+PostgresAsyncCatalogReader (асинхронный psycopg, подготовленные запросы).
+
+Перед замером проверяется, что оба читателя возвращают одинаковые данные.
+База — тестовая, как в benchmarks.run.
+
+Запуск из каталога bot:
+    python -m benchmarks.catalog_reader
+    python -m benchmarks.catalog_reader --calls 5000 --concurrency 20
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import sys
+import time
+
+from asgiref.sync import sync_to_async
+
+from .run import _percentile, seed, setup_django
+
+
+def _calls(catalog, product_ids: list[int]) -> dict[str, object]:
+    """Имя замера -> функция (reader, i) -> awaitable; i перебирает категории и товары"""
+    leaves, page_size = catalog.leaves, 5
+    return {
+        'version': lambda reader, i: reader.version(),
+        'categories': lambda reader, i: reader.categories(),
+        'faqs': lambda reader, i: reader.faqs(),
+        'product_count': lambda reader, i: reader.product_count(leaves[i % len(leaves)]),
+        'product_page': lambda reader, i: reader.product_page(leaves[i % len(leaves)], (i % 2) * page_size, page_size),
+        'product': lambda reader, i: reader.product(product_ids[i % len(product_ids)]),
+    }
+
+
+def _comparable(value):
+    # Product сравнивается по полям: у моделей равенство только по pk
+    if hasattr(value, '_meta'):
+        return {f.attname: getattr(value, f.attname) for f in value._meta.concrete_fields}
+    return value
+
+
+async def check_same(readers: dict, calls: dict) -> list[str]:
+    mismatches = []
+    for name, call in calls.items():
+        for i in range(3):
+            results = [_comparable(await call(reader, i)) for reader in readers.values()]
+            if any(result != results[0] for result in results[1:]):
+                mismatches.append(name)
+                break
+    return mismatches
+
+
+async def measure(reader, call, calls: int, concurrency: int) -> tuple[float, float, float]:
+    """(вызовов в секунду, p50 мс, p99 мс)"""
+    latencies: list[float] = []
+    counter = itertools.count()
+
+    async def worker():
+        while (i := next(counter)) < calls:
+            start = time.perf_counter()
+            await call(reader, i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return calls / elapsed, _percentile(latencies, .50) * 1000, _percentile(latencies, .99) * 1000
+
+
+async def run_all(args) -> int:
+    from django.db import connections
+    from src.utils.catalog_reader import OrmCatalogReader, PostgresAsyncCatalogReader
+
+    readers = {'orm': OrmCatalogReader(), 'async': PostgresAsyncCatalogReader(args.concurrency)}
+    try:
+        catalog = await sync_to_async(seed)(args.categories, args.products, args.faqs)
+        product_ids = [pk for ids in catalog.products.values() for pk in ids]
+        calls = _calls(catalog, product_ids)
+
+        mismatches = await check_same(readers, calls)
+        if mismatches:
+            print(f"Читатели вернули разные данные: {', '.join(mismatches)}")
+            return 1
+
+        print(f"{'запрос':<15}" + ''.join(f'{f"{name} {column}":>18}' for name in readers
+                                          for column in ('в сек.', 'p50 мс', 'p99 мс')))
+        for name, call in calls.items():
+            row = []
+            for reader in readers.values():
+                # прогрев: соединения пула и подготовка запроса на сервере
+                await measure(reader, call, args.concurrency * 2, args.concurrency)
+                row.extend(await measure(reader, call, args.calls, args.concurrency))
+            print(f'{name:<15}' + ''.join(f'{value:>18.2f}' for value in row))
+        return 0
+    finally:
+        for reader in readers.values():
+            await reader.close()
+        await sync_to_async(connections.close_all)()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запросы каталога: ORM против асинхронного драйвера')
+    parser.add_argument('--calls', type=int, default=2000, help='Вызовов каждого запроса')
+    parser.add_argument('--concurrency', type=int, default=10, help='Одновременных вызовов')
+    parser.add_argument('--categories', type=int, default=10, help='Корневых категорий')
+    parser.add_argument('--products', type=int, default=12, help='Товаров в подкатегории')
+    parser.add_argument('--faqs', type=int, default=20, help='Вопросов FAQ')
+    args = parser.parse_args()
+
+    setup_django()
+    logging.getLogger('bot').setLevel(logging.WARNING)
+    from django.db import connections
+    from django.test.utils import setup_databases, teardown_databases
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        code = asyncio.run(run_all(args))
+    finally:
+        connections.close_all()
+        teardown_databases(old_config, verbosity=0)
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+"""
+Нагрузочный прогон бота без Telegram: синтетические Update подаются в настоящий Dispatcher
+со всеми роутерами и middleware, запросы к Bot API записывает FakeSession.
+
+База — отдельная тестовая (test_<DB_NAME>), её создаёт и удаляет Django, как в manage.py test.
+Нужен PostgreSQL: хэндлеры корзины используют INSERT ... ON CONFLICT и CTE с DELETE/UPDATE.
+
+Запуск из каталога bot (в контейнере: docker compose run --rm bot python -m benchmarks.run):
+    python -m benchmarks.run                    # прогон и сравнение с baselines.json
+    python -m benchmarks.run --save-baseline    # записать результаты как новую базовую линию
+    python -m benchmarks.run --check            # код выхода 1, если выросло число запросов к базе
+    CATALOG_READER=async python -m benchmarks.run   # каталог через асинхронный драйвер
+
+Отдельные запросы каталога, ORM против асинхронного драйвера: python -m benchmarks.catalog_reader
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Union, get_args, get_origin
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Message, Update
+from asgiref.sync import sync_to_async
+
+BASELINES_PATH = Path(__file__).resolve().parent / 'baselines.json'
+BOT_ID = 42
+# первые обновления прогревают кэши и соединения и в результат не идут
+WARMUP_USERS = 5
+QUERIES_TOLERANCE = 0.05
+
+
+class FakeSession(BaseSession):
+    """Сессия Bot API, которая ничего не отправляет, а отвечает правдоподобными объектами"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls: dict[str, int] = {}
+        self._message_ids = itertools.count(1_000_000)
+
+    def _result(self, method):
+        returning = method.__returning__
+        types = get_args(returning) if get_origin(returning) in (Union, type(int | str)) else (returning,)
+        if Message in types:
+            chat_id = getattr(method, 'chat_id', None) or 0
+            return {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': getattr(method, 'text', None) or '',
+            }
+        return True
+
+    async def make_request(self, bot, method, timeout=None):
+        name = type(method).__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        content = json.dumps({'ok': True, 'result': self._result(method)})
+        return self.check_response(bot=bot, method=method, status_code=200, content=content).result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+def _user(chat_id: int) -> dict:
+    return {'id': chat_id, 'is_bot': False, 'first_name': f'User {chat_id}', 'username': f'user{chat_id}'}
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _update(self, **payload) -> Update:
+        return Update.model_validate({'update_id': next(self._update_ids), **payload})
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': _user(chat_id),
+            'text': text,
+        }
+
+    def message(self, chat_id: int, text: str) -> Update:
+        return self._update(message=self._message(chat_id, text))
+
+    def callback(self, chat_id: int, data: str) -> Update:
+        return self._update(callback_query={
+            'id': str(next(self._update_ids)),
+            'from': _user(chat_id),
+            'chat_instance': str(chat_id),
+            'message': {**self._message(chat_id, 'menu'), 'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Bot'}},
+            'data': data,
+        })
+
+    def pre_checkout(self, chat_id: int, order_id: int, total: int) -> Update:
+        return self._update(pre_checkout_query={
+            'id': str(next(self._update_ids)),
+            'from': _user(chat_id),
+            'currency': 'RUB',
+            'total_amount': total,
+            'invoice_payload': f'order_{order_id}',
+            'order_info': {
+                'name': f'User {chat_id}',
+                'phone_number': '+70000000000',
+                'shipping_address': {
+                    'country_code': 'RU', 'state': '', 'city': 'Москва', 'street_line1': 'Тверская, 1',
+                    'street_line2': '', 'post_code': '101000',
+                },
+            },
+        })
+
+
+@dataclass
+class Catalog:
+    parents: list[int]
+    leaves: list[int]
+    products: dict[int, list[int]]
+    faqs: list[int]
+
+
+def seed(categories: int, products_per_category: int, faqs: int) -> Catalog:
+    """Каталог: categories корневых категорий по две подкатегории с товарами"""
+    from store.models import FAQ, Category, Product
+
+    parents = Category.objects.bulk_create([Category(name=f'Категория {i}') for i in range(categories)])
+    leaves = Category.objects.bulk_create([
+        Category(name=f'{parent.name}.{j}', parent=parent) for parent in parents for j in range(2)
+    ])
+    products = Product.objects.bulk_create([
+        Product(
+            category=leaf, description=f'Товар {leaf.name}.{k}', price=Decimal(100 + k),
+            # остатка хватает на весь прогон; file_id — как у товара, фото которого уже отправлялось
+            quantity=1_000_000, in_stock=True, image='products/bench.jpg', image_file_id=f'bench-{leaf.id}-{k}',
+        )
+        for leaf in leaves for k in range(products_per_category)
+    ])
+    faq_objects = FAQ.objects.bulk_create([
+        FAQ(question=f'Вопрос {i}?', answer=f'Ответ на вопрос {i}.') for i in range(faqs)
+    ])
+    by_category: dict[int, list[int]] = {}
+    for product in products:
+        by_category.setdefault(product.category_id, []).append(product.id)
+    return Catalog([c.id for c in parents], [c.id for c in leaves], by_category, [f.id for f in faq_objects])
+
+
+def browse_script(factory: UpdateFactory, catalog: Catalog, chat_id: int) -> list[Update]:
+    parent = catalog.parents[chat_id % len(catalog.parents)]
+    leaf = catalog.leaves[chat_id % len(catalog.leaves)]
+    products = catalog.products[leaf]
+    return [
+        factory.message(chat_id, '/start'),
+        factory.callback(chat_id, 'catalog'),
+        factory.callback(chat_id, f'category_{parent}'),
+        factory.callback(chat_id, f'category_{leaf}'),
+        factory.callback(chat_id, f'prod_page_{leaf}_2'),
+        factory.callback(chat_id, f'product_{products[chat_id % len(products)]}'),
+        factory.callback(chat_id, 'faq'),
+        factory.callback(chat_id, f'question_{catalog.faqs[chat_id % len(catalog.faqs)]}'),
+    ]
+
+
+def add_to_cart_script(factory: UpdateFactory, catalog: Catalog, chat_id: int) -> list[Update]:
+    leaf = catalog.leaves[chat_id % len(catalog.leaves)]
+    updates = []
+    for product_id in catalog.products[leaf][:2]:
+        updates.append(factory.callback(chat_id, f'add_item_{product_id}'))
+        updates.append(factory.message(chat_id, '2'))
+    return updates
+
+
+def cart_view_script(factory: UpdateFactory, catalog: Catalog, chat_id: int) -> list[Update]:
+    return [factory.callback(chat_id, 'cart'), factory.message(chat_id, '/cart')]
+
+
+def checkout_script(factory: UpdateFactory, catalog: Catalog, chat_id: int) -> list[Update]:
+    return [factory.callback(chat_id, 'order')]
+
+
+def pre_checkout_scripts(factory: UpdateFactory, chat_ids: list[int]) -> dict[int, list[Update]]:
+    from store.models import Order
+
+    orders = Order.objects.filter(user__chat_id__in=chat_ids, status='pending').values_list(
+        'user__chat_id', 'id', 'total_amount'
+    )
+    return {chat_id: [factory.pre_checkout(chat_id, order_id, int(total * 100))]
+            for chat_id, order_id, total in orders}
+
+
+@dataclass
+class Result:
+    updates: int
+    updates_per_s: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    queries_per_update: float
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _db_queries_total() -> float:
+    from src.utils.instrumentation import update_db_queries
+
+    return sum(value for name, _, value in update_db_queries.samples() if name.endswith('_sum'))
+
+
+async def run_scenario(dp, bot, scripts: dict[int, list[Update]], concurrency: int) -> Result:
+    """Обновления одного чата идут по порядку, разные чаты — параллельно, как в супервизоре"""
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_chat(updates: list[Update]):
+        async with semaphore:
+            for update in updates:
+                start = time.perf_counter()
+                await dp.feed_update(bot, update)
+                latencies.append(time.perf_counter() - start)
+
+    queries_before = _db_queries_total()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_chat(updates) for updates in scripts.values()))
+    elapsed = time.perf_counter() - start
+    queries = _db_queries_total() - queries_before
+
+    latencies.sort()
+    count = len(latencies)
+    return Result(
+        updates=count,
+        updates_per_s=round(count / elapsed, 1) if elapsed else 0.0,
+        p50_ms=round(_percentile(latencies, .50) * 1000, 2),
+        p95_ms=round(_percentile(latencies, .95) * 1000, 2),
+        p99_ms=round(_percentile(latencies, .99) * 1000, 2),
+        queries_per_update=round(queries / count, 2),
+    )
+
+
+class _NoDelayAsyncio:
+    """asyncio для хэндлеров без пауз «для глаз пользователя» перед удалением сообщений"""
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    @staticmethod
+    async def sleep(delay, result=None):
+        return await asyncio.sleep(0, result)
+
+
+async def run_all(args) -> dict[str, Result]:
+    from django.db import connections
+    from src.handlers import cart
+    from src.main import dp, register_routers
+    from src.utils.catalog_reader import catalog_reader
+    from src.utils.db_pool import setup_db_pool
+    from src.utils.replicas import setup_replicas
+
+    register_routers(dp)
+    setup_db_pool(dp)
+    setup_replicas(dp)
+    cart.asyncio = _NoDelayAsyncio()
+    session = FakeSession()
+    bot = Bot(token=f'{BOT_ID}:BENCHMARK', session=session)
+
+    try:
+        catalog = await sync_to_async(seed)(args.categories, args.products, args.faqs)
+        factory = UpdateFactory()
+        warmup = range(10_000_000, 10_000_000 + WARMUP_USERS)
+        users = range(1, args.users + 1)
+
+        scenarios = [
+            ('browse', browse_script),
+            ('add_to_cart', add_to_cart_script),
+            ('cart_view', cart_view_script),
+            ('checkout', checkout_script),
+        ]
+        results = {}
+        for name, script in scenarios:
+            await run_scenario(dp, bot, {u: script(factory, catalog, u) for u in warmup}, args.concurrency)
+            results[name] = await run_scenario(
+                dp, bot, {u: script(factory, catalog, u) for u in users}, args.concurrency
+            )
+            print(f'  {name}: {results[name].updates} обновлений', file=sys.stderr)
+        await run_scenario(dp, bot, await sync_to_async(pre_checkout_scripts)(factory, list(warmup)),
+                           args.concurrency)
+        results['pre_checkout'] = await run_scenario(
+            dp, bot, await sync_to_async(pre_checkout_scripts)(factory, list(users)), args.concurrency
+        )
+        print(f'  вызовы Bot API: {dict(sorted(session.calls.items()))}', file=sys.stderr)
+        return results
+    finally:
+        # соединения потока sync_to_async и пула каталога держат тестовую базу, иначе её не удалить
+        await catalog_reader.close()
+        await sync_to_async(connections.close_all)()
+
+
+def _cell(result: Result, baseline: dict, field: str) -> str:
+    current, base = getattr(result, field), baseline.get(field)
+    return f'{current} ({(current - base) / base:+.0%})' if base else str(current)
+
+
+COLUMNS = ('updates_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_update')
+
+
+def report(results: dict[str, Result], baselines: dict) -> list[str]:
+    """Печатает таблицу; возвращает сценарии, где запросов к базе стало больше базовой линии"""
+    regressions = []
+    print(f"{'сценарий':<14}{'обн.':>7}" + ''.join(f'{column:>22}' for column in COLUMNS))
+    for name, result in results.items():
+        base = baselines.get(name, {})
+        print(f'{name:<14}{result.updates:>7}' + ''.join(f'{_cell(result, base, c):>22}' for c in COLUMNS))
+        # время зависит от машины, а число запросов — нет: его и проверяем
+        # (с небольшим допуском на сверку версии каталога по таймеру)
+        if base and result.queries_per_update > base['queries_per_update'] + QUERIES_TOLERANCE:
+            regressions.append(name)
+    return regressions
+
+
+def setup_django():
+    backend = Path(os.environ.get('DJANGO_PATH', Path(__file__).resolve().parents[2] / 'backend'))
+    if not backend.exists():
+        backend = Path('/django_app')
+    sys.path.insert(0, str(backend))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TelegramStore.settings')
+    import django
+    django.setup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон хэндлеров бота')
+    parser.add_argument('--users', type=int, default=200, help='Чатов в каждом сценарии')
+    parser.add_argument('--concurrency', type=int, default=50, help='Чатов, обрабатываемых одновременно')
+    parser.add_argument('--categories', type=int, default=10, help='Корневых категорий')
+    parser.add_argument('--products', type=int, default=12, help='Товаров в подкатегории')
+    parser.add_argument('--faqs', type=int, default=20, help='Вопросов FAQ')
+    parser.add_argument('--save-baseline', action='store_true', help='Записать результаты в baselines.json')
+    parser.add_argument('--check', action='store_true', help='Ошибка, если запросов к базе больше базовой линии')
+    args = parser.parse_args()
+
+    setup_django()
+    # журнал каждого обновления заметно замедляет прогон
+    logging.getLogger('aiogram.event').setLevel(logging.WARNING)
+    logging.getLogger('bot').setLevel(logging.WARNING)
+    from django.db import connections
+    from django.test.utils import setup_databases, teardown_databases
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        results = asyncio.run(run_all(args))
+    finally:
+        connections.close_all()
+        teardown_databases(old_config, verbosity=0)
+
+    stored = json.loads(BASELINES_PATH.read_text(encoding='utf-8')) if BASELINES_PATH.exists() else {}
+    regressions = report(results, stored.get('scenarios', {}))
+    if args.save_baseline:
+        stored = {
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'options': {k: v for k, v in vars(args).items() if k not in ('save_baseline', 'check')},
+            'scenarios': {name: asdict(result) for name, result in results.items()},
+        }
+        BASELINES_PATH.write_text(json.dumps(stored, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+        print(f'Базовая линия записана в {BASELINES_PATH}')
+    if args.check and regressions:
+        print(f"Запросов к базе стало больше: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,3 +6,58 @@ PRODUCTS_PER_PAGE = 5
 YOOKASSA_PROVIDER_TOKEN = os.environ.get("YOOKASSA_PROVIDER_TOKEN")
 BASE_DIR = Path(__file__).resolve().parent.parent
 ORDERS_CSV_PATH = BASE_DIR / 'data' / 'orders.csv'
+# Выгрузка заказов пишется пачками: по размеру пачки или раз в интервал, секунд.
+# Файлы ротируются по дням (orders-ГГГГ-ММ-ДД.csv), при ORDERS_EXPORT_GZIP=1 сжимаются.
+# При нескольких процессах у каждого воркера свой файл: orders-ГГГГ-ММ-ДД-w<номер>.csv
+ORDERS_EXPORT_BATCH_SIZE = int(os.environ.get("ORDERS_EXPORT_BATCH_SIZE", 100))
+ORDERS_EXPORT_FLUSH_INTERVAL = float(os.environ.get("ORDERS_EXPORT_FLUSH_INTERVAL", 5))
+ORDERS_EXPORT_GZIP = os.environ.get("ORDERS_EXPORT_GZIP", "0").lower() in ("1", "true", "yes")
+# Как часто (в секундах) бот сверяет версию каталога с базой
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", 30))
+# orm — запросы каталога через ORM; async — напрямую через асинхронный psycopg (только PostgreSQL)
+CATALOG_READER = os.environ.get("CATALOG_READER", "orm")
+CATALOG_READER_POOL_SIZE = int(os.environ.get("CATALOG_READER_POOL_SIZE", 4))
+# Сколько готовых клавиатур держать в памяти
+KEYBOARD_CACHE_SIZE = int(os.environ.get("KEYBOARD_CACHE_SIZE", 512))
+# Хранилище id последней карточки товара в чате: memory или redis
+DETAIL_STORE_BACKEND = os.environ.get("DETAIL_STORE_BACKEND", "memory")
+DETAIL_STORE_MAX_SIZE = int(os.environ.get("DETAIL_STORE_MAX_SIZE", 100_000))
+# Telegram позволяет редактировать и удалять сообщения бота только 48 часов
+DETAIL_STORE_TTL = int(os.environ.get("DETAIL_STORE_TTL", 48 * 60 * 60))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+# Хранилище состояний FSM: memory, redis или postgres
+FSM_STORAGE = os.environ.get("FSM_STORAGE", "memory")
+# Время жизни незавершённого диалога, секунд
+FSM_TTL = int(os.environ.get("FSM_TTL", 24 * 60 * 60))
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", 8080))
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", 1))
+HEALTHCHECK_PATH = os.environ.get("HEALTHCHECK_PATH", "/healthz")
+# Количество процессов-воркеров супервизора (python -m src.supervisor)
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", os.cpu_count() or 1))
+SUPERVISOR_STATUS_PORT = int(os.environ.get("SUPERVISOR_STATUS_PORT", 8081))
+SEARCH_RESULTS_LIMIT = 10
+# Неоплаченный заказ держит резерв товара не дольше RESERVATION_TTL секунд
+RESERVATION_TTL = int(os.environ.get("RESERVATION_TTL", 30 * 60))
+RESERVATION_SWEEP_INTERVAL = int(os.environ.get("RESERVATION_SWEEP_INTERVAL", 60))
+RESERVATION_SWEEP_BATCH = int(os.environ.get("RESERVATION_SWEEP_BATCH", 500))
+# Лимиты исходящих запросов к Telegram на весь бот: всего, в личный чат, в группу (сообщений в секунду)
+OUTBOUND_GLOBAL_RATE = float(os.environ.get("OUTBOUND_GLOBAL_RATE", 30))
+OUTBOUND_CHAT_RATE = float(os.environ.get("OUTBOUND_CHAT_RATE", 1))
+OUTBOUND_CHAT_BURST = float(os.environ.get("OUTBOUND_CHAT_BURST", 3))
+OUTBOUND_GROUP_RATE = float(os.environ.get("OUTBOUND_GROUP_RATE", 20 / 60))
+OUTBOUND_GROUP_BURST = float(os.environ.get("OUTBOUND_GROUP_BURST", 3))
+# Где держать bucket'ы лимитов: memory (воркеры супервизора делят OUTBOUND_GLOBAL_RATE поровну)
+# или redis (общие для всех процессов; обязательно для webhook с WEBHOOK_WORKERS > 1)
+OUTBOUND_LIMITS_BACKEND = os.environ.get("OUTBOUND_LIMITS_BACKEND", "memory")
+# Сколько раз повторять запрос после TelegramRetryAfter
+OUTBOUND_MAX_RETRIES = int(os.environ.get("OUTBOUND_MAX_RETRIES", 3))
+# Порт /metrics в формате Prometheus для polling; 0 — не запускать.
+# Воркеры супервизора слушают METRICS_PORT + 1 + номер. В webhook /metrics на порту webhook,
+# а при WEBHOOK_WORKERS > 1 каждый воркер слушает METRICS_PORT + номер
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9100))
@@ -1,9 +1,12 @@
 class InsufficientStockError(Exception):
-    def __init__(self, product, available, requested):
+    def __init__(self, product, available, requested, shortages=None):
         self.product = product
         self.available = available
         self.requested = requested
+        # все нехватающие позиции: [(product, available, requested), ...]
+        self.shortages = shortages or [(product, available, requested)]
         super().__init__(
-            f"❌ Недостаточно товара: {product.description}. "
-            f"Доступно: {available}, Запрошено: {requested}"
+            "❌ Недостаточно товара: " + "; ".join(
+                f"{p.description}. Доступно: {a}, Запрошено: {r}" for p, a, r in self.shortages
+            )
         )
@@ -1,6 +1,8 @@
 import asyncio
 
 from aiogram import types, F
+from asgiref.sync import sync_to_async
+from django.db import transaction
 
 from store.models import CartItem, Product, Cart
 from users.models import TelegramUser
@@ -10,28 +12,51 @@ from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from ..logger import logger
 from ..states.states import CartStates
+from ..utils.rate_limit import background_priority
 
 router = Router()
 
 
-async def get_cart_items(chat_id: int) -> list[CartItem]:
+async def get_cart(chat_id: int) -> tuple[Cart | None, list[CartItem]]:
+    """Открытая корзина с готовыми итогами и её позиции"""
     cart = await Cart.objects.filter(user__chat_id=chat_id, is_ordered=False).afirst()
-    if not cart:
-        return []
-    return [ci async for ci in CartItem.objects.filter(cart=cart).select_related('product')]
+    if not cart or not cart.item_count:
+        return cart, []
+    return cart, [ci async for ci in CartItem.objects.filter(cart=cart).select_related('product')]
+
+
+remove_cart_item = sync_to_async(Cart.remove_item)
+clear_open_cart = sync_to_async(Cart.clear_open)
+
+
+@sync_to_async
+def add_to_cart(user: types.User, product_id: int, quantity: int):
+    if Cart.add_item(user.id, product_id, quantity):
+        return
+    # первая покупка: создаём пользователя и корзину, затем повторяем вставку
+    with transaction.atomic():
+        tg_user, _ = TelegramUser.objects.get_or_create(chat_id=user.id, defaults={
+            'username': user.username or '',
+            'first_name': user.first_name,
+            'last_name': user.last_name
+        })
+        Cart.ensure_open(tg_user)
+        if not Cart.add_item(user.id, product_id, quantity):
+            raise Product.DoesNotExist(f"Товар {product_id} не найден")
 
 
 @router.callback_query(F.data.startswith('add_item_'))
 async def ask_quantity(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     product_id = int(callback.data.split('_')[2])
+    sent = await callback.message.answer("Введите количество товара:")
+    # одна запись данных вместо двух: каждая — обращение к хранилищу FSM
     await state.update_data(
         product_id=product_id,
         origin_chat_id=callback.message.chat.id,
-        origin_message_id=callback.message.message_id
+        origin_message_id=callback.message.message_id,
+        prompt_msg_id=sent.message_id
     )
-    sent = await callback.message.answer("Введите количество товара:")
-    await state.update_data(prompt_msg_id=sent.message_id)
     await state.set_state(CartStates.waiting_for_quantity)
 
 
@@ -47,34 +72,21 @@ async def process_quantity(message: Message, state: FSMContext):
     except ValueError:
         msg = await message.reply("Пожалуйста, введите корректное число (больше 0).")
         await asyncio.sleep(1)
-        await msg.delete()
+        # уборка служебных сообщений не должна задерживать ответы другим пользователям
+        with background_priority():
+            await msg.delete()
         return
-    user_id = message.from_user.id
-    user = await TelegramUser.objects.aget(chat_id=user_id)
-    cart, _ = await Cart.objects.aget_or_create(user=user, is_ordered=False)
-    try:
-        item = await CartItem.objects.aget(cart=cart, product_id=product_id)
-
-        item.quantity += quantity
-        await item.asave(update_fields=['quantity'])
-
-    except CartItem.DoesNotExist:
-        product = await Product.objects.aget(pk=product_id)
-        await CartItem.objects.acreate(
-            cart=cart,
-            product=product,
-            quantity=quantity,
-            price=product.price
-        )
+    await add_to_cart(message.from_user, product_id, quantity)
 
     sent: Message = await message.answer(f"✅ Добавлено в корзину")
     await state.clear()
     await asyncio.sleep(1)
     try:
-        await message.bot.delete_messages(
-            chat_id=message.chat.id,
-            message_ids=[prompt_id, message.message_id, sent.message_id]
-        )
+        with background_priority():
+            await message.bot.delete_messages(
+                chat_id=message.chat.id,
+                message_ids=[prompt_id, message.message_id, sent.message_id]
+            )
     except Exception:
         logger.exception(
             "Ошибка при удалении одного из сообщений: "
@@ -87,11 +99,8 @@ async def process_quantity(message: Message, state: FSMContext):
 @router.callback_query(F.data.startswith('remove_item_'))
 async def remove_item(call: types.CallbackQuery):
     item_id = int(call.data.split('_')[2])
-    cart = await Cart.objects.filter(user__chat_id=call.message.chat.id, is_ordered=False).aget()
-    item = await CartItem.objects.filter(id=item_id, cart=cart).aget()
-    await item.adelete()
-    items = await get_cart_items(call.message.chat.id)
-    text, kb = build_cart_view(items)
+    await remove_cart_item(call.message.chat.id, item_id)
+    text, kb = build_cart_view(*await get_cart(call.message.chat.id))
     await call.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
     await call.answer("✅ Товар удалён")
 
@@ -103,8 +112,7 @@ async def show_cart(update: types.CallbackQuery | types.Message):
         message = update.message
     else:
         message = update
-    items = await get_cart_items(message.chat.id)
-    text, kb = build_cart_view(items)
+    text, kb = build_cart_view(*await get_cart(message.chat.id))
     if isinstance(update, types.CallbackQuery):
         await message.edit_text(text, reply_markup=kb, parse_mode="HTML")
     else:
@@ -114,12 +122,8 @@ async def show_cart(update: types.CallbackQuery | types.Message):
 @router.callback_query(F.data == 'clear_cart')
 async def clear_cart(call: types.CallbackQuery):
     # Никаких операций с TelegramUser здесь!
-    await CartItem.objects. \
-        filter(
-        cart__user__chat_id=call.message.chat.id,
-        cart__is_ordered=False
-    ).adelete()
-    _, res = build_cart_view([])
+    await clear_open_cart(call.message.chat.id)
+    _, res = build_cart_view(None, [])
     await call.message.edit_text(
         'Корзина очищена',
         reply_markup=res
@@ -1,26 +1,42 @@
+import re
 from pathlib import Path
 
-from aiogram import Router, F
+from aiogram import Bot, Router, F
+from aiogram.filters import CommandStart
 
 from ..config import CATEGORIES_PER_PAGE, PRODUCTS_PER_PAGE
-from store.models import Category, Product
+from store.models import Product
 from ..keyboards.catalog_kb import categories_kb, products_kb, main_menu_kb, product_detail_kb, out_of_stock_kb
-from aiogram.types import FSInputFile, CallbackQuery, Message, InputMediaPhoto
+from aiogram.types import FSInputFile, CallbackQuery, Message, InputMediaPhoto, InlineKeyboardMarkup
 from ..init_django import MEDIA_ROOT_BOT
+from ..keyboards.cache import markup_cache
 from aiogram.exceptions import TelegramBadRequest
 
 from ..logger import logger
+from ..utils.catalog_cache import CachedCategory, catalog_cache
+from ..utils.catalog_reader import catalog_reader
+from ..utils.detail_messages import create_detail_message_store
 from ..utils.paginator import Paginator
 
 router = Router()
 
+# id последней карточки товара в каждом чате
+last_detail_message = create_detail_message_store()
 
-async def get_categories(parent_id: None | int = None):
-    if parent_id:
-        categories = [c async for c in Category.objects.filter(parent_id=parent_id).all()]
-    else:
-        categories = [c async for c in Category.objects.filter(parent__isnull=True).all()]
-    return categories
+
+async def get_categories(parent_id: None | int = None) -> list[CachedCategory]:
+    return await catalog_cache.get_categories(parent_id)
+
+
+async def _categories_page(parent_id: None | int, page: int) -> InlineKeyboardMarkup:
+    """Готовая клавиатура страницы категорий (из кэша, если есть)"""
+    version = catalog_cache.version
+    pag = Paginator(await get_categories(parent_id), CATEGORIES_PER_PAGE)
+    items, page = pag.get_page(page)
+    return markup_cache.get_or_build(
+        ('categories', parent_id or None, page), version,
+        lambda: categories_kb(items, parent_id, page, pag.total_pages)
+    )
 
 
 @router.message(F.text == '/start')
@@ -38,12 +54,9 @@ async def cmd_start(message_or_callback: Message | CallbackQuery):
 
 @router.callback_query(F.data == 'catalog')
 async def show_catalog(cb: CallbackQuery):
-    cats = await get_categories(None)
-    pag = Paginator(cats, CATEGORIES_PER_PAGE)
-    items, page = pag.get_page(1)
     await cb.message.edit_text(
         "Выберите категорию:",
-        reply_markup=categories_kb(items, None, page, pag.total_pages)
+        reply_markup=await _categories_page(None, 1)
     )
 
 
@@ -52,12 +65,9 @@ async def paginate_categories(cb: CallbackQuery):
     rest = cb.data[len('cat_page_'):]
     page_str, parent = rest.split('_', 1)
     parent_id = int(parent) if parent.isdigit() else None
-    cats = await get_categories(parent_id)
-    pag = Paginator(cats, CATEGORIES_PER_PAGE)
-    items, page = pag.get_page(int(page_str))
     await cb.message.edit_text(
         "Выберите категорию:",
-        reply_markup=categories_kb(items, parent_id, page, pag.total_pages)
+        reply_markup=await _categories_page(parent_id, int(page_str))
     )
 
 
@@ -65,34 +75,38 @@ async def paginate_categories(cb: CallbackQuery):
 async def show_subcategories_or_products(cb: CallbackQuery):
     # удаляем карточку товара, если была
     chat_id = cb.from_user.id
-    if m := last_detail_message.pop(chat_id, None):
+    if m := await last_detail_message.pop(chat_id):
         try:
             await cb.bot.delete_message(chat_id, m)
         except:
             pass
 
     cat_id = int(cb.data.split('_')[1])
+    category = await catalog_cache.get_category(cat_id)
     subcats = await get_categories(cat_id)
     if subcats:
-        pag = Paginator(subcats, CATEGORIES_PER_PAGE)
-        items, page = pag.get_page(1)
         await cb.message.edit_text(
-            f"Категория: {(await Category.objects.aget(id=cat_id)).name}",
-            reply_markup=categories_kb(items, cat_id, page, pag.total_pages)
+            f"Категория: {category.name}" if category else "Выберите категорию:",
+            reply_markup=await _categories_page(cat_id, 1)
         )
+    elif category:
+        await _show_products(cb, category, 1)
     else:
-        await _show_products(cb, await Category.objects.aget(id=cat_id), 1)
+        await cb.answer("Категория не найдена", show_alert=True)
 
 
-async def _show_products(cb: CallbackQuery, category: Category, page: int):
-    prods = [p async for p in Product.objects.filter(category=category)]
-    pag = Paginator(prods, PRODUCTS_PER_PAGE)
-    items, page = pag.get_page(page)
-    parent = await Category.objects.aget(id=category.parent_id) if category.parent_id else None
+async def _show_products(cb: CallbackQuery, category: CachedCategory, page: int):
+    version = catalog_cache.version
+    items, page, total_pages = await catalog_cache.get_products_page(category.id, page, PRODUCTS_PER_PAGE)
+    parent = await catalog_cache.get_category(category.parent_id) if category.parent_id else None
+    kb = markup_cache.get_or_build(
+        ('products', category.id, page), version,
+        lambda: products_kb(items, category.id, parent.id if parent else 0, page, total_pages)
+    )
 
     await cb.message.edit_text(
-        f"Товары: {(parent.name + ' → ') if parent else ''}{category.name} (стр. {page}/{pag.total_pages})",
-        reply_markup=products_kb(items, category.id, parent.id if parent else 0, page, pag.total_pages)
+        f"Товары: {(parent.name + ' → ') if parent else ''}{category.name} (стр. {page}/{total_pages})",
+        reply_markup=kb
     )
 
 
@@ -100,39 +114,85 @@ async def _show_products(cb: CallbackQuery, category: Category, page: int):
 async def paginate_products(cb: CallbackQuery):
     rest = cb.data[len('prod_page_'):]
     cat_str, page_str = rest.split('_', 1)
-    cat = await Category.objects.aget(id=int(cat_str))
+    cat = await catalog_cache.get_category(int(cat_str))
+    if cat is None:
+        await cb.answer("Категория не найдена", show_alert=True)
+        return
     await _show_products(cb, cat, int(page_str))
 
 
-@router.callback_query(F.data.startswith('product_'))
-async def handle_product_detail(cb: CallbackQuery):
-    await cb.answer()
-    prod = await Product.objects.aget(id=int(cb.data.split('_')[1]))
-    path = MEDIA_ROOT_BOT / Path(prod.image.name)
+async def _remember_photo_file_id(prod: Product, message: Message | bool):
+    """Сохраняет file_id, выданный Telegram после первой загрузки фото товара"""
+    if prod.image_file_id or not isinstance(message, Message) or not message.photo:
+        return
+    # фильтр по хэшу и копии: если изображение успели заменить или уменьшить, старый file_id не сохранится
+    await Product.objects.filter(
+        pk=prod.pk, image_hash=prod.image_hash, image_telegram=prod.image_telegram.name or ''
+    ).aupdate(image_file_id=message.photo[-1].file_id)
+
+
+async def _forget_photo_file_id(prod: Product):
+    await Product.objects.filter(pk=prod.pk, image_file_id=prod.image_file_id).aupdate(image_file_id='')
+    prod.image_file_id = ''
+
+
+def _product_photo(prod: Product) -> str | FSInputFile:
+    if prod.image_file_id:
+        return prod.image_file_id
+    # уменьшенная копия для Telegram, пока её нет — оригинал
+    image = prod.image_telegram or prod.image
+    return FSInputFile(MEDIA_ROOT_BOT / Path(image.name))
+
+
+async def send_product_card(bot: Bot, chat_id: int, product_id: int):
+    """Карточка товара в чате; предыдущая карточка заменяется"""
+    prod = await catalog_reader.product(product_id)
     in_stock_mark = "✅" if prod.in_stock else "❌"
     text = f"<b>{prod.description}</b>\n💵 {prod.price}₽\n В наличии: {prod.quantity} шт. {in_stock_mark}"
-    media = InputMediaPhoto(media=FSInputFile(path),
-                            caption=text,
-                            parse_mode="HTML")
 
-    chat_id = cb.from_user.id
     if not prod.in_stock:
         kb = out_of_stock_kb()
     else:
         kb = product_detail_kb(prod.id)
-    if msg_id := last_detail_message.get(chat_id):
+    if msg_id := await last_detail_message.get(chat_id):
+        media = InputMediaPhoto(media=_product_photo(prod),
+                                caption=text,
+                                parse_mode="HTML")
         try:
-            await cb.bot.edit_message_media(chat_id=chat_id, message_id=msg_id, media=media,
-                                            reply_markup=kb)
+            edited = await bot.edit_message_media(chat_id=chat_id, message_id=msg_id, media=media,
+                                                  reply_markup=kb)
+            await _remember_photo_file_id(prod, edited)
             return
         except TelegramBadRequest:
             try:
-                await cb.bot.delete_message(chat_id, msg_id)
+                await bot.delete_message(chat_id, msg_id)
             except:
                 logger.error(f"Не удалось удалить сообщение {msg_id}")
-    sent = await cb.message.answer_photo(media.media, caption=media.caption, parse_mode="HTML",
-                                         reply_markup=kb)
-    last_detail_message[chat_id] = sent.message_id
+    try:
+        sent = await bot.send_photo(chat_id, _product_photo(prod), caption=text, parse_mode="HTML",
+                                    reply_markup=kb)
+    except TelegramBadRequest:
+        if not prod.image_file_id:
+            raise
+        # file_id мог стать недействительным — загружаем файл заново
+        logger.warning(f"Telegram отклонил file_id фото товара {prod.id}, загружаем заново")
+        await _forget_photo_file_id(prod)
+        sent = await bot.send_photo(chat_id, _product_photo(prod), caption=text, parse_mode="HTML",
+                                    reply_markup=kb)
+    await _remember_photo_file_id(prod, sent)
+    await last_detail_message.set(chat_id, sent.message_id)
+
+
+@router.callback_query(F.data.startswith('product_'))
+async def handle_product_detail(cb: CallbackQuery):
+    await cb.answer()
+    await send_product_card(cb.bot, cb.from_user.id, int(cb.data.split('_')[1]))
 
 
-last_detail_message: dict[int, int] = {}
+@router.message(CommandStart(deep_link=True), F.text.regexp(r'^/start product_(\d+)$').as_('match'))
+async def open_product_link(message: Message, match: re.Match):
+    """Ссылка t.me/<бот>?start=product_<id> из результатов inline-поиска"""
+    try:
+        await send_product_card(message.bot, message.chat.id, int(match.group(1)))
+    except Product.DoesNotExist:
+        await message.answer("Товар не найден", reply_markup=main_menu_kb())
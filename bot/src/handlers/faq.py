@@ -1,8 +1,10 @@
 from aiogram import Dispatcher, types, Router, F
 from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 from store.models import FAQ
+from ..keyboards.cache import markup_cache
 from ..keyboards.catalog_kb import main_menu_kb
 from ..keyboards.faq_kb import faq_kb, back_to_faq_kb
+from ..utils.catalog_cache import catalog_cache
 
 router = Router()
 
@@ -17,26 +19,26 @@ async def show_faq(update: types.CallbackQuery | types.Message):
         message = update
         is_callback = False
     text = 'Вы можете задать свой вопрос в чат, упомянув бота. \nЧасто задаваемые вопросы:'
-    items = [f async for f in FAQ.objects.all()]
+    version = catalog_cache.version
+    items = await catalog_cache.get_faqs()
+    kb = markup_cache.get_or_build(('faq',), version, lambda: faq_kb(items))
 
     if is_callback:
         await message.edit_text(
             text,
-            reply_markup=faq_kb(items),
+            reply_markup=kb,
             parse_mode="HTML"
         )
         await update.answer()
     else:
         await message.answer(
             text,
-            reply_markup=faq_kb(items),
+            reply_markup=kb,
             parse_mode="HTML"
         )
 
 
-@router.inline_query
-async def handle_faq_inline(query: InlineQuery):
-    text = query.query.strip().lower()
+async def faq_inline_results(text: str) -> list[InlineQueryResultArticle]:
     if text:
         faqs = FAQ.objects.filter(question__icontains=text)[:10]
     else:
@@ -57,13 +59,22 @@ async def handle_faq_inline(query: InlineQuery):
                 )
             )
         )
+    return results
+
+
+@router.inline_query
+async def handle_faq_inline(query: InlineQuery):
+    results = await faq_inline_results(query.query.strip().lower())
     await query.answer(results, cache_time=1, is_personal=True)
 
 
 @router.callback_query(lambda c: c.data.startswith('question_'))
 async def show_question_details(call: types.CallbackQuery):
-    faq_id = call.data.split('_', 1)[1]
-    faq = await FAQ.objects.aget(id=faq_id)
+    faq_id = int(call.data.split('_', 1)[1])
+    faq = await catalog_cache.get_faq(faq_id)
+    if faq is None:
+        await call.answer("Вопрос не найден", show_alert=True)
+        return
     await call.message.edit_text(
         f"<b>{faq.question}</b>\n"
         f"{faq.answer}",
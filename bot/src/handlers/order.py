@@ -1,20 +1,18 @@
-import asyncio
-from decimal import Decimal
-
 from aiogram.types import (
     Message,
     PreCheckoutQuery,
     LabeledPrice,
 )
 from aiogram import Router, types, F
-from django.db import transaction
+from django.db import models, transaction
+from django.utils import timezone
 from asgiref.sync import sync_to_async
 
 from src.exceptions.insufficient_product import InsufficientStockError
 from src.logger import logger
-from ..config import YOOKASSA_PROVIDER_TOKEN, ORDERS_CSV_PATH
+from ..config import YOOKASSA_PROVIDER_TOKEN
 from src.utils.address import format_address
-from src.utils.export_orders import save_to_csv_async
+from src.utils.export_orders import order_exporter
 from store.models import Cart, CartItem, Order, OrderItem, Product
 from users.models import TelegramUser
 
@@ -23,54 +21,56 @@ router = Router()
 
 @sync_to_async
 def reserve_items(items: list[CartItem]):
-    with transaction.atomic():
-        for item in items:
-            # Блокируем строку продукта
-            product = Product.objects.select_for_update().get(pk=item.product.pk)
-
-            # Правильный расчет доступного количества
-            available = product.quantity - product.reserved
+    requested: dict[int, int] = {}
+    for item in items:
+        requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
 
-            # Проверяем достаточно ли товара
-            if available < item.quantity:
-                raise InsufficientStockError(
-                    product,
-                    available=available,
-                    requested=item.quantity
-                )
+    with transaction.atomic():
+        # Блокируем все строки одним запросом в порядке pk — одинаковый порядок исключает взаимоблокировки
+        products = {
+            p.pk: p for p in Product.objects.select_for_update().filter(pk__in=requested).order_by('pk')
+        }
 
-            # Резервируем товар
-            product.reserved += item.quantity
-            product.save(update_fields=['reserved'])
-            logger.debug(f"Зарезервировано {item.quantity} шт. {product.description} для заказа")
+        # Проверяем все позиции сразу, чтобы сообщить обо всех нехватках
+        shortages = []
+        for product_id, quantity in requested.items():
+            product = products.get(product_id)
+            if product is None:
+                product = next(item.product for item in items if item.product_id == product_id)
+                shortages.append((product, 0, quantity))
+            elif product.quantity - product.reserved < quantity:
+                shortages.append((product, product.quantity - product.reserved, quantity))
+        if shortages:
+            raise InsufficientStockError(*shortages[0], shortages=shortages)
+
+        # Резервируем одним UPDATE; условие в WHERE страхует от резерва сверх остатка
+        condition = models.Q()
+        for product_id, quantity in requested.items():
+            condition |= models.Q(pk=product_id, quantity__gte=models.F('reserved') + quantity)
+        updated = Product.objects.filter(condition).update(
+            reserved=models.F('reserved') + models.Case(
+                *[models.When(pk=product_id, then=models.Value(quantity)) for product_id, quantity in requested.items()],
+                output_field=models.PositiveIntegerField()
+            )
+        )
+        if updated != len(requested):
+            raise RuntimeError(f"Зарезервировано {updated} позиций из {len(requested)}")
+        logger.debug(f"Зарезервировано позиций: {updated}")
 
 
 @sync_to_async
-def cancel_reservation(order: Order):
-    with transaction.atomic():
-        items = OrderItem.objects.filter(order=order).select_related('product')
-        for item in items:
-            product = item.product
-            product.reserved -= item.quantity
-            if product.reserved < 0:
-                product.reserved = 0
-            product.save(update_fields=['reserved'])
+def cancel_order(order: Order) -> bool:
+    return order.cancel()
 
 
 @sync_to_async
-def confirm_order(order: Order):
-    with transaction.atomic():
-        # Получаем все товары заказа
-        items = OrderItem.objects.filter(order=order).select_related('product')
+def prolong_order(order: Order, **fields) -> bool:
+    return order.prolong_reservation(**fields)
 
-        for item in items:
-            product = item.product
 
-            # Списание товара
-            product.quantity -= item.quantity
-            product.reserved -= item.quantity
-            product.in_stock = product.quantity > 0
-            product.save(update_fields=['quantity', 'reserved', 'in_stock'])
+@sync_to_async
+def confirm_order(order: Order, payment_id: str) -> bool:
+    return order.confirm_stock(payment_id)
 
 
 @router.callback_query(F.data == 'order')
@@ -78,33 +78,34 @@ async def checkout(call: types.CallbackQuery):
     if call.from_user.is_bot:
         return
     user, _ = await TelegramUser.objects.aupdate_or_create(chat_id=call.message.chat.id, defaults={
-        'username': call.message.chat.username,
+        'username': call.message.chat.username or '',
         'first_name': call.message.chat.first_name,
         'last_name': call.message.chat.last_name
     })
     logger.info(f"Пользователь {call.from_user.id} хочет оформить заказ")
     cart = await Cart.objects.filter(user__chat_id=call.message.chat.id, is_ordered=False).aget()
+    # счёт — по текущим ценам: если товар подешевел или подорожал, обновляем позиции и итоги корзины
+    if changed := await sync_to_async(cart.refresh_prices)():
+        logger.info(f"В корзине #{cart.id} обновлены цены позиций: {changed}")
     items = [ci async for ci in CartItem.objects.filter(cart=cart).select_related('product').all()]
-    total = int(sum(Decimal(item.product.price) * item.quantity for item in items) * 100)  # в копейках
-
-    active_order = await Order.objects.filter(
-        cart__user__chat_id=call.message.chat.id,
-        status='pending'
-    ).aget()
-
-    if active_order:
-        # Отменяем предыдущий резерв
-        await cancel_reservation(active_order)
-        # Помечаем заказ как отмененный
-        active_order.status = 'canceled'
-        await active_order.asave()
+    # сумма — по тем же позициям, что резервируются и попадают в заказ: корзину могли изменить
+    # параллельно, и её сохранённый итог разошёлся бы со счётом
+    total = int(sum(item.price * item.quantity for item in items) * 100)  # в копейках
+
+    active_order = await Order.objects.filter(user=user, status='pending').afirst()
+
+    # предыдущий заказ отменяем вместе с резервом; его мог уже отменить сборщик просроченных
+    if active_order and await cancel_order(active_order):
         logger.info(f"Отменен предыдущий заказ #{active_order.id}")
 
     new_order, created = await Order.objects.aupdate_or_create(
         cart=cart,
         defaults={
+            'user': user,
             'status': 'pending',
-            'total_amount': total / 100
+            'total_amount': total / 100,
+            # срок резерва отсчитывается от последнего оформления
+            'created_at': timezone.now()
         }
     )
 
@@ -123,7 +124,7 @@ async def checkout(call: types.CallbackQuery):
                 order=new_order,
                 product=item.product,
                 quantity=item.quantity,
-                price=item.product.price
+                price=item.price
             )
             for item in items
         ]
@@ -145,17 +146,17 @@ async def checkout(call: types.CallbackQuery):
 
 
     except InsufficientStockError as e:
-        error_msg = (
-            f"❌ Не удалось зарезервировать товар:\n"
-            f"• {e.product.description}\n"
-            f"Доступно: {e.available}, Заказано: {e.requested}"
+        error_msg = "❌ Не удалось зарезервировать товар:\n" + "\n".join(
+            f"• {product.description}\nДоступно: {available}, Заказано: {requested}"
+            for product, available, requested in e.shortages
         )
-        await call.answer(error_msg, show_alert=True)
+        # текст уведомления ограничен 200 символами
+        await call.answer(error_msg[:200], show_alert=True)
         logger.warning(str(e))
     except Exception as e:
         logger.exception(f"Ошибка при создании заказа: {str(e)}")
         if 'new_order' in locals():
-            await cancel_reservation(new_order)
+            await cancel_order(new_order)
             await call.answer("❌ Не удалось оформить заказ. Скорее всего, слишком большая стоимость. Попробуйте снова.")
 
 
@@ -170,15 +171,16 @@ async def pre_checkout(pre_checkout_query: PreCheckoutQuery):
 
         order = await Order.objects.select_related('cart').aget(id=order_id)
 
-        if order.status != 'pending':
-            raise ValueError("Заказ уже обработан")
-
-        # Обновляем данные доставки
+        # Сохраняем данные доставки и продлеваем резерв: после ok=True деньги спишут,
+        # и сборщик просроченных не должен успеть отменить заказ до successful_payment
         shipping = pre_checkout_query.order_info.shipping_address
-        order.full_name = pre_checkout_query.order_info.name
-        order.phone = pre_checkout_query.order_info.phone_number
-        order.address = format_address(shipping)
-        await order.asave(update_fields=['full_name', 'phone', 'address'])
+        if not await prolong_order(
+                order,
+                full_name=pre_checkout_query.order_info.name,
+                phone=pre_checkout_query.order_info.phone_number,
+                address=format_address(shipping),
+        ):
+            raise ValueError("Заказ уже обработан")
         logger.info(f"Данные доставки обновлены для заказа #{order_id}")
         async for item in order.items.select_related('product'):
             product = item.product
@@ -196,7 +198,7 @@ async def pre_checkout(pre_checkout_query: PreCheckoutQuery):
             error_message = f"❌ Товара '{e.product.description}' недостаточно на складе. Осталось {e.product.quantity - e.product.reserved}"
         logger.error(f"Ошибка pre_checkout: {error_message}")
         if 'order' in locals():
-            await cancel_reservation(order)
+            await cancel_order(order)
         await pre_checkout_query.answer(ok=False, error_message=error_message[:200])
     except Exception as e:
         logger.exception("Неизвестная ошибка в pre_checkout")
@@ -214,20 +216,29 @@ async def successful_payment(message: Message):
     try:
         order = await Order.objects.select_related('cart').aget(id=order_id)
 
-        # 1. Подтверждаем заказ и списываем товары
-        await confirm_order(order)
-
-        # 2. Обновляем статус заказа
-        order.status = 'paid'
-        order.payment_id = payment.provider_payment_charge_id
-        await order.asave(update_fields=['status', 'payment_id'])
+        # 1. Переводим заказ в paid и списываем товары — одной транзакцией
+        if not await confirm_order(order, payment.provider_payment_charge_id):
+            await order.arefresh_from_db(fields=['status', 'payment_id'])
+            if order.status == 'paid':
+                # повторная доставка того же платежа: всё уже сделано
+                logger.warning(f"Заказ #{order_id} уже оплачен, повторное подтверждение пропущено")
+                return
+            # заказ отменили (истёк резерв) пока шла оплата: товар не списываем, деньги возвращаем
+            await Order.objects.filter(pk=order.pk, payment_id__isnull=True).aupdate(
+                payment_id=payment.provider_payment_charge_id
+            )
+            logger.error(f"Оплачен заказ #{order_id} в статусе {order.status}: нужен возврат платежа "
+                         f"{payment.provider_payment_charge_id}")
+            await message.answer("❌ Заказ был отменён до поступления оплаты. Деньги будут возвращены, "
+                                 "оформите заказ заново.")
+            return
 
-        # 3. Помечаем корзину как оплаченную
+        # 2. Помечаем корзину как оплаченную
         order.cart.is_ordered = True
         await order.cart.asave(update_fields=['is_ordered'])
 
-        # 4. Сохраняем в CSV
-        asyncio.create_task(save_to_csv_async(order, ORDERS_CSV_PATH))
+        # 3. Ставим заказ в очередь на выгрузку в CSV
+        order_exporter.submit(order.id)
 
         await message.answer("✅ Заказ успешно оплачен!")
         logger.info(f"Заказ #{order_id} полностью обработан")
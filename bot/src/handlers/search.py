@@ -0,0 +1,71 @@
+from aiogram import F, Router
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.filters import Command, CommandObject
+from aiogram.types import (
+    InlineQuery,
+    InlineQueryResultArticle,
+    InlineQueryResultCachedPhoto,
+    InputTextMessageContent,
+    Message,
+)
+from aiogram.utils.deep_linking import create_start_link
+from asgiref.sync import sync_to_async
+
+from store.models import Product
+from store.search import search_products
+from ..config import SEARCH_RESULTS_LIMIT
+from ..keyboards.catalog_kb import product_link_kb, search_results_kb
+from .faq import faq_inline_results
+
+router = Router()
+
+search = sync_to_async(search_products)
+
+
+def _product_inline_result(product: Product, link: str) -> InlineQueryResultArticle | InlineQueryResultCachedPhoto:
+    caption = f"<b>{product.description}</b>\n💵 {product.price}₽"
+    # сообщение inline-режима приходит в callback без message — вместо кнопок корзины ссылка в бота
+    kb = product_link_kb(link) if product.in_stock else None
+    if product.image_file_id:
+        # фото уже загружено в Telegram — показываем его как миниатюру
+        return InlineQueryResultCachedPhoto(
+            id=f'product_{product.id}',
+            photo_file_id=product.image_file_id,
+            title=product.description[:64],
+            description=f"{product.price}₽",
+            caption=caption,
+            parse_mode="HTML",
+            reply_markup=kb,
+        )
+    return InlineQueryResultArticle(
+        id=f'product_{product.id}',
+        title=product.description[:64],
+        description=f"{product.price}₽" + ("" if product.in_stock else " · нет в наличии"),
+        input_message_content=InputTextMessageContent(message_text=caption, parse_mode="HTML"),
+        reply_markup=kb,
+    )
+
+
+@router.inline_query(F.query.len() > 0)
+async def handle_product_inline(query: InlineQuery):
+    text = query.query.strip()
+    products = await search(text, SEARCH_RESULTS_LIMIT)
+    if not products:
+        # товаров нет — отвечает поиск по FAQ
+        raise SkipHandler()
+    results = [_product_inline_result(p, await create_start_link(query.bot, f'product_{p.id}')) for p in products]
+    results += await faq_inline_results(text.lower())
+    await query.answer(results, cache_time=1, is_personal=True)
+
+
+@router.message(Command('search'))
+async def cmd_search(message: Message, command: CommandObject):
+    text = (command.args or '').strip()
+    if not text:
+        await message.answer("Напишите, что искать: /search <запрос>")
+        return
+    products = await search(text, SEARCH_RESULTS_LIMIT)
+    if not products:
+        await message.answer("Ничего не найдено 😔")
+        return
+    await message.answer(f"Найдено по запросу «{text}»:", reply_markup=search_results_kb(products))
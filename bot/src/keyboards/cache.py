@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from aiogram.types import InlineKeyboardMarkup
+
+from ..config import KEYBOARD_CACHE_SIZE
+
+
+class MarkupCache:
+    """
+    LRU-кэш готовых клавиатур. Ключ дополняется версией каталога:
+    при переходе на новую версию кэш очищается целиком. Версию нужно брать
+    до чтения данных, чтобы клавиатура не попала в кэш под более новой версией.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.version: int | None = None
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, InlineKeyboardMarkup] = OrderedDict()
+
+    def get_or_build(
+            self, key: Hashable, version: int | None, build: Callable[[], InlineKeyboardMarkup]
+    ) -> InlineKeyboardMarkup:
+        if version is None or (self.version is not None and version < self.version):
+            # данные устаревшей версии не кэшируем
+            return build()
+        if version != self.version:
+            self._data.clear()
+            self.version = version
+        markup = self._data.get(key)
+        if markup is not None:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return markup
+        self.misses += 1
+        markup = build()
+        self._data[key] = markup
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return markup
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+markup_cache = MarkupCache(KEYBOARD_CACHE_SIZE)
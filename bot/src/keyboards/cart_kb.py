@@ -1,30 +1,28 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup
-from store.models import CartItem, Product
+from store.models import Cart, CartItem, Product
 
 
-def build_cart_view(items: list[CartItem]) -> tuple[str, InlineKeyboardMarkup]:
+def build_cart_view(cart: Cart | None, items: list[CartItem]) -> tuple[str, InlineKeyboardMarkup]:
     """
     Возвращает пару (текст корзины, InlineKeyboardMarkup) с кнопками удаления,
     очистки, оформления и перехода в каталог.
+    Итог берётся из cart.total_amount, позиции не суммируются.
     """
     kb = InlineKeyboardBuilder()
     if not items:
         text = "🛒 Ваша корзина пуста."
     else:
-        total = 0
         lines = []
-        # Строки текста и кнопки удаления
+        # Строки текста и кнопки удаления; цена — зафиксированная при добавлении в корзину
         for ci in items:
             p: Product = ci.product
-            cost = p.price * ci.quantity
-            total += cost
-            lines.append(f"• {p.description}\n  {ci.quantity} × {p.price}₽ = {cost}₽")
+            lines.append(f"• {p.description}\n  {ci.quantity} × {ci.price}₽ = {ci.price * ci.quantity}₽")
             kb.button(
                 text=f"❌ Удалить {p.description}",
                 callback_data=f"remove_item_{ci.id}"
             )
-        lines.append(f"\n<b>Итого: {total}₽</b>")
+        lines.append(f"\n<b>Итого: {cart.total_amount}₽</b>")
         text = "\n".join(lines)
 
         # Управляющие кнопки
@@ -96,6 +96,23 @@ def product_detail_kb(product_id: int) -> InlineKeyboardMarkup:
     kb.adjust(1, 2)
     return kb.as_markup()
 
+def product_link_kb(url: str) -> InlineKeyboardMarkup:
+    """Кнопка-ссылка в бота для сообщений inline-режима: callback-кнопки там без message"""
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🛒 Открыть в магазине", url=url)
+    return kb.as_markup()
+
+
+def search_results_kb(products: list[Product]) -> InlineKeyboardMarkup:
+    """Найденные товары, по одному в строке"""
+    kb = InlineKeyboardBuilder()
+    for product in products:
+        kb.button(text=f"{product.description} — {product.price}₽", callback_data=f"product_{product.id}")
+    kb.button(text="⬅️ В начало", callback_data='back_to_start')
+    kb.adjust(1)
+    return kb.as_markup()
+
+
 def out_of_stock_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="Нет в наличии", callback_data=f"no_action")
@@ -1,60 +1,172 @@
 import os
 import sys
+import time
 import asyncio
+from contextlib import contextmanager
 
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand
 
-from src.config import ORDERS_CSV_PATH
+from src.config import BOT_MODE, METRICS_PORT
 from src.init_django import setup_django
 
 from src.logger import logger
-from src.utils.export_orders import save_to_csv_async
+from src.states.storage import PostgresFSMStorage, create_fsm_storage
+from src.utils.db_pool import setup_db_pool
+from src.utils.export_orders import order_exporter
+from src.utils.instrumentation import setup_instrumentation
+from src.utils.metrics import start_metrics_server
+from src.utils.rate_limit import RateLimitMiddleware, outbound_scheduler
+from src.utils.replicas import setup_replicas
+from src.utils.reservation_sweeper import run_reservation_sweeper
+from src.webhook import run_webhook
 
-dp = Dispatcher()
+fsm_storage, fsm_options = create_fsm_storage()
+dp = Dispatcher(storage=fsm_storage, **fsm_options)
+# фоновые задачи процесса, останавливаются в on_shutdown
+background_tasks: set[asyncio.Task] = set()
 
 
 
-async def on_startup():
-    if not setup_django():
-        logger.error("Не удалось инициализировать Django. Выход...")
-        sys.exit(1)
+def register_routers(dispatcher: Dispatcher):
+    """Регистрация хэндлеров; общая для polling и webhook"""
+    from src.handlers import start, catalog, cart, faq, order, search
+    dispatcher.include_router(start.router)
+    dispatcher.include_router(catalog.router)
+    dispatcher.include_router(cart.router)
+    dispatcher.include_router(search.router)
+    dispatcher.include_router(faq.router)
+    dispatcher.include_router(order.router)
 
+
+BOT_COMMANDS = [
+    BotCommand(command="start", description="Запустить бота"),
+    BotCommand(command="cart", description="Показать корзину"),
+    BotCommand(command="faq", description="Часто задаваемые вопросы"),
+    BotCommand(command="search", description="Поиск товаров"),
+]
+setup_instrumentation(dp, [command.command for command in BOT_COMMANDS])
+
+
+@contextmanager
+def _timed(phases: dict[str, float], name: str):
+    start = time.perf_counter()
     try:
-        from store.models import Product, Category, Cart, CartItem, Order, OrderItem, FAQ
-        from users.models import TelegramUser
-    except Exception as e:
-        logger.error(f"Ошибка импорта: {e}. Выход...")
-        sys.exit(1)
-
-    # Регистрация хэндлеров
-    from src.handlers import start, catalog, cart, faq, order
-    dp.include_router(start.router)
-    dp.include_router(catalog.router)
-    dp.include_router(cart.router)
-    dp.include_router(faq.router)
-    dp.include_router(order.router)
-    # Регистрация команд
-    bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"))
-    await bot.set_my_commands([
-        BotCommand(command="start", description="Запустить бота"),
-        BotCommand(command="cart", description="Показать корзину"),
-        BotCommand(command="faq", description="Часто задаваемые вопросы"),
-    ])
-    logger.info("✅ Бот успешно запущен")
+        yield
+    finally:
+        phases[name] = time.perf_counter() - start
+
+
+async def _purge_fsm():
+    if isinstance(fsm_storage, PostgresFSMStorage):
+        purged = await fsm_storage.purge_expired()
+        logger.info(f"Удалено истёкших состояний FSM: {purged}")
+
+
+async def _preload_catalog():
+    from src.utils.catalog_cache import catalog_cache
+
+    try:
+        await catalog_cache.preload()
+    except Exception:
+        # не критично: кэш загрузится при первом обращении
+        logger.exception("Не удалось заранее загрузить каталог")
+
+
+async def _timed_call(phases: dict[str, float], name: str, coro):
+    with _timed(phases, name):
+        await coro
+
+
+async def start_singleton_tasks(bot: Bot, phases: dict[str, float]):
+    """
+    Задачи на весь бот, а не на процесс: команды, очистка FSM, сборщик резервов.
+    При нескольких процессах их запускает только один — супервизор или воркер webhook #0
+    """
+    await asyncio.gather(
+        _timed_call(phases, 'commands', bot.set_my_commands(BOT_COMMANDS)),
+        _timed_call(phases, 'fsm', _purge_fsm()),
+    )
+    background_tasks.add(asyncio.create_task(run_reservation_sweeper()))
+
+
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+
+async def on_startup(bot: Bot, singleton_tasks: bool = True, worker: int | None = None):
+    phases: dict[str, float] = {}
+    start = time.perf_counter()
+
+    with _timed(phases, 'django'):
+        if not setup_django():
+            logger.error("Не удалось инициализировать Django. Выход...")
+            sys.exit(1)
+
+        try:
+            from store.models import Product, Category, Cart, CartItem, Order, OrderItem, FAQ
+            from users.models import TelegramUser
+        except Exception as e:
+            logger.error(f"Ошибка импорта: {e}. Выход...")
+            sys.exit(1)
+
+        if setup_db_pool(dp):
+            logger.info("Соединения с базой берутся из пула")
+        if setup_replicas(dp):
+            logger.info("Каталог читается с реплик")
+
+    with _timed(phases, 'routers'):
+        register_routers(dp)
+
+    # прогрев кэша каталога идёт параллельно с разовыми задачами
+    steps = [_timed_call(phases, 'catalog', _preload_catalog())]
+    if singleton_tasks:
+        steps.append(start_singleton_tasks(bot, phases))
+    await asyncio.gather(*steps)
+    order_exporter.start(worker)
+    breakdown = ', '.join(f'{name} {seconds:.2f} с' for name, seconds in phases.items())
+    logger.info(f"✅ Бот успешно запущен за {time.perf_counter() - start:.2f} с ({breakdown})")
 
 
 async def on_shutdown():
+    # выгрузка дописывает очередь до конца, а не отменяется
+    await order_exporter.close()
+    await stop_background_tasks()
+    from src.utils.catalog_reader import catalog_reader
+    await catalog_reader.close()
     logger.info("Бот остановлен")
 
 
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+
+def create_bot() -> Bot:
+    bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"))
+    # все исходящие запросы проходят через общий планировщик лимитов Telegram
+    bot.session.middleware(RateLimitMiddleware(outbound_scheduler))
+    return bot
+
+
 async def main():
     logger.info("Запуск бота...")
-    dp.startup.register(on_startup)
-    dp.shutdown.register(on_shutdown)
-    bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"))
-    await dp.start_polling(bot)
+    bot = create_bot()
+    # polling не работает, пока у бота установлен webhook
+    await bot.delete_webhook()
+    metrics = await start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if metrics:
+            await metrics.cleanup()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == 'webhook':
+        logger.info("Запуск бота в режиме webhook...")
+        run_webhook(dp, create_bot)
+    else:
+        asyncio.run(main())
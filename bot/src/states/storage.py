@@ -0,0 +1,173 @@
+import json
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisEventIsolation
+from asgiref.sync import sync_to_async
+from redis.asyncio import Redis
+
+from ..config import FSM_STORAGE, FSM_TTL, REDIS_URL
+
+
+def _state_name(state: StateType) -> str | None:
+    return state.state if isinstance(state, State) else state
+
+
+class RedisFSMStorage(BaseStorage):
+    """
+    FSM в Redis: состояние и данные лежат в одном hash, каждая запись — один pipeline
+    вместе с продлением TTL, update_data — чтение и запись в одной транзакции (WATCH/MULTI).
+    """
+
+    def __init__(self, redis: Redis, ttl: int, key_builder: KeyBuilder | None = None):
+        self.redis = redis
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        redis_key = self.key_builder.build(key)
+        state = _state_name(state)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if state is None:
+                pipe.hdel(redis_key, 'state')
+            else:
+                pipe.hset(redis_key, 'state', state)
+            pipe.expire(redis_key, self.ttl)
+            await pipe.execute()
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        value = await self.redis.hget(self.key_builder.build(key), 'state')
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        redis_key = self.key_builder.build(key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if data:
+                pipe.hset(redis_key, 'data', json.dumps(data))
+            else:
+                pipe.hdel(redis_key, 'data')
+            pipe.expire(redis_key, self.ttl)
+            await pipe.execute()
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        value = await self.redis.hget(self.key_builder.build(key), 'data')
+        return json.loads(value) if value else {}
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        redis_key = self.key_builder.build(key)
+
+        async def merge(pipe) -> dict[str, Any]:
+            raw = await pipe.hget(redis_key, 'data')
+            current = json.loads(raw) if raw else {}
+            current.update(data)
+            pipe.multi()
+            pipe.hset(redis_key, 'data', json.dumps(current))
+            pipe.expire(redis_key, self.ttl)
+            return current
+
+        return await self.redis.transaction(merge, redis_key, value_from_callable=True)
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+class PostgresFSMStorage(BaseStorage):
+    """
+    FSM в таблице users.FSMRecord. Каждая операция — один запрос: запись через
+    INSERT ... ON CONFLICT с продлением срока жизни, update_data сливает данные
+    прямо в jsonb и возвращает результат через RETURNING.
+    """
+
+    def __init__(self, ttl: int, key_builder: KeyBuilder | None = None):
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True)
+
+    @staticmethod
+    def _model():
+        # модели доступны только после setup_django(), а хранилище создаётся раньше
+        from users.models import FSMRecord
+        return FSMRecord
+
+    @sync_to_async
+    def _upsert(self, key: StorageKey, state_sql: str, data_sql: str, params: list, returning: bool = False):
+        from django.db import connection
+
+        table = self._model()._meta.db_table
+        expired = f'{table}.expires_at < now()'
+        sql = f'''
+            INSERT INTO {table} (key, state, data, expires_at)
+            VALUES (%s, %s, %s::jsonb, now() + %s * interval '1 second')
+            ON CONFLICT (key) DO UPDATE SET
+                state = {state_sql.format(expired=expired, table=table)},
+                data = {data_sql.format(expired=expired, table=table)},
+                expires_at = EXCLUDED.expires_at
+            {'RETURNING data' if returning else ''}
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.key_builder.build(key), *params, self.ttl])
+            if returning:
+                data = cursor.fetchone()[0]
+                return json.loads(data) if isinstance(data, str) else data
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._upsert(
+            key,
+            'EXCLUDED.state',
+            "CASE WHEN {expired} THEN '{{}}'::jsonb ELSE {table}.data END",
+            [_state_name(state), '{}'],
+        )
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        from django.utils import timezone
+
+        return await self._model().objects.filter(
+            key=self.key_builder.build(key), expires_at__gt=timezone.now()
+        ).values_list('state', flat=True).afirst()
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._upsert(
+            key,
+            'CASE WHEN {expired} THEN NULL ELSE {table}.state END',
+            'EXCLUDED.data',
+            [None, json.dumps(dict(data))],
+        )
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        from django.utils import timezone
+
+        data = await self._model().objects.filter(
+            key=self.key_builder.build(key), expires_at__gt=timezone.now()
+        ).values_list('data', flat=True).afirst()
+        return data or {}
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        return await self._upsert(
+            key,
+            'CASE WHEN {expired} THEN NULL ELSE {table}.state END',
+            "CASE WHEN {expired} THEN '{{}}'::jsonb ELSE {table}.data END || EXCLUDED.data",
+            [None, json.dumps(dict(data))],
+            returning=True,
+        )
+
+    async def purge_expired(self) -> int:
+        """Удаляет истёкшие диалоги; чтение их и так не видит"""
+        from django.utils import timezone
+
+        deleted, _ = await self._model().objects.filter(expires_at__lt=timezone.now()).adelete()
+        return deleted
+
+    async def close(self) -> None:
+        pass
+
+
+def create_fsm_storage() -> tuple[BaseStorage, dict]:
+    """Возвращает хранилище FSM и дополнительные аргументы для Dispatcher"""
+    if FSM_STORAGE == 'redis':
+        redis = Redis.from_url(REDIS_URL)
+        # изоляция событий через Redis нужна, когда один чат обслуживают несколько процессов
+        return RedisFSMStorage(redis, FSM_TTL), {'events_isolation': RedisEventIsolation(redis)}
+    if FSM_STORAGE == 'postgres':
+        return PostgresFSMStorage(FSM_TTL), {}
+    return MemoryStorage(), {}
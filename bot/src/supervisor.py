@@ -0,0 +1,278 @@
+"""
+Супервизор: получает обновления одним long polling и раскладывает их по процессам-воркерам
+по chat_id. Обновления одного чата всегда попадают в один воркер и обрабатываются по порядку,
+разные чаты — параллельно на нескольких ядрах.
+
+Разовые задачи бота (команды, очистка FSM, сборщик резервов) выполняет сам супервизор.
+Воркер подтверждает каждое обработанное обновление; неподтверждённые обновления упавшего
+воркера отправляются заново перезапущенному — обработка «хотя бы один раз».
+
+Запуск: python -m src.supervisor
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+
+import aiohttp
+from aiohttp import web
+
+from src.config import METRICS_PORT, SHARD_WORKERS, SUPERVISOR_STATUS_PORT
+from src.logger import logger
+from src.utils.metrics import Counter, Gauge, metrics_handler, start_metrics_server
+
+worker_queue_depth = Gauge('bot_worker_queue_depth', 'Обновления в очереди воркера')
+worker_restarts = Counter('bot_worker_restarts_total', 'Перезапуски воркеров')
+
+POLL_TIMEOUT = 30
+STOP = None
+
+
+def extract_chat_id(raw: dict) -> int:
+    """chat_id из «сырого» обновления; для событий без чата — id пользователя"""
+    for key, event in raw.items():
+        if not isinstance(event, dict):
+            continue
+        if 'chat' in event:
+            return event['chat']['id']
+        if isinstance(event.get('message'), dict) and 'chat' in event['message']:
+            return event['message']['chat']['id']
+        if 'from' in event:
+            return event['from']['id']
+        if 'user' in event:
+            return event['user']['id']
+    return 0
+
+
+def _worker_main(index: int, workers: int, updates: multiprocessing.Queue, acks: multiprocessing.Queue):
+    # остановкой воркеров управляет супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_run_worker(index, workers, updates, acks))
+
+
+async def _run_worker(index: int, workers: int, updates: multiprocessing.Queue, acks: multiprocessing.Queue):
+    from src.main import create_bot, dp
+    from src.utils.rate_limit import outbound_scheduler
+
+    # чаты закреплены за воркерами, а общий лимит бота делится между ними
+    outbound_scheduler.share_global_rate(workers)
+    bot = create_bot()
+    # у каждого воркера свои метрики и свой порт
+    metrics = await start_metrics_server(METRICS_PORT + 1 + index) if METRICS_PORT else None
+    # разовые задачи уже запущены супервизором
+    await dp.emit_startup(bot=bot, dispatcher=dp, singleton_tasks=False, worker=index)
+    logger.info(f"Воркер #{index} (pid {os.getpid()}) готов")
+
+    loop = asyncio.get_running_loop()
+    chat_locks: dict[int, asyncio.Lock] = {}
+    chat_pending: dict[int, int] = {}
+    tasks: set[asyncio.Task] = set()
+
+    async def handle(chat_id: int, raw: dict):
+        lock = chat_locks.setdefault(chat_id, asyncio.Lock())
+        chat_pending[chat_id] = chat_pending.get(chat_id, 0) + 1
+        try:
+            # Lock отдаёт управление в порядке очереди — порядок обновлений чата сохраняется
+            async with lock:
+                await dp.feed_raw_update(bot, raw)
+        except Exception:
+            logger.exception(f"Ошибка обработки обновления {raw.get('update_id')} в воркере #{index}")
+        finally:
+            acks.put((index, raw['update_id']))
+            chat_pending[chat_id] -= 1
+            if not chat_pending[chat_id]:
+                del chat_pending[chat_id]
+                del chat_locks[chat_id]
+
+    try:
+        while True:
+            item = await loop.run_in_executor(None, updates.get)
+            if item is STOP:
+                break
+            task = asyncio.create_task(handle(*item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+        if metrics:
+            await metrics.cleanup()
+        logger.info(f"Воркер #{index} остановлен")
+
+
+class Supervisor:
+    def __init__(self, token: str, workers: int):
+        self.api_url = f"https://api.telegram.org/bot{token}/"
+        self.ctx = multiprocessing.get_context('spawn')
+        self.queues = [self.ctx.Queue() for _ in range(workers)]
+        self.acks = self.ctx.Queue()
+        # отправленные воркеру и ещё не подтверждённые обновления: update_id -> (chat_id, raw)
+        self.unacked: list[dict[int, tuple[int, dict]]] = [{} for _ in range(workers)]
+        # уже отправленные повторно: второй раз упавшее на них обновление не повторяется
+        self.redelivered: set[int] = set()
+        self.processes: list[multiprocessing.Process | None] = [None] * workers
+        self.restarts = [0] * workers
+        self.stopping = asyncio.Event()
+
+    def _start_worker(self, index: int):
+        process = self.ctx.Process(
+            target=_worker_main, args=(index, len(self.queues), self.queues[index], self.acks), name=f'bot-worker-{index}',
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    def queue_depth(self, index: int) -> int:
+        try:
+            return self.queues[index].qsize()
+        except NotImplementedError:  # macOS
+            return -1
+
+    async def _poll(self):
+        offset = 0
+        timeout = aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await session.post(self.api_url + 'deleteWebhook')
+            while not self.stopping.is_set():
+                try:
+                    async with session.post(
+                            self.api_url + 'getUpdates', json={'offset': offset, 'timeout': POLL_TIMEOUT}
+                    ) as response:
+                        payload = await response.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Ошибка getUpdates: {e!r}")
+                    await asyncio.sleep(1)
+                    continue
+                if not payload.get('ok'):
+                    retry_after = payload.get('parameters', {}).get('retry_after', 1)
+                    logger.error(f"getUpdates вернул ошибку: {payload.get('description')}")
+                    await asyncio.sleep(retry_after)
+                    continue
+                for raw in payload['result']:
+                    offset = raw['update_id'] + 1
+                    chat_id = extract_chat_id(raw)
+                    index = chat_id % len(self.queues)
+                    self.unacked[index][raw['update_id']] = (chat_id, raw)
+                    self.queues[index].put((chat_id, raw))
+
+    def _drain_acks(self):
+        while True:
+            try:
+                index, update_id = self.acks.get_nowait()
+            except queue.Empty:
+                return
+            self.unacked[index].pop(update_id, None)
+            self.redelivered.discard(update_id)
+
+    def _restart_worker(self, index: int):
+        process = self.processes[index]
+        self._drain_acks()
+        logger.error(f"Воркер #{index} завершился с кодом {process.exitcode}, перезапускаем")
+        self.restarts[index] += 1
+        worker_restarts.inc(worker=index)
+        # очередь упавшего воркера бросаем: всё, что он не подтвердил, в ней или потеряно вместе
+        # с ним — отправляем заново в новую очередь в исходном порядке
+        self.queues[index].cancel_join_thread()
+        self.queues[index].close()
+        self.queues[index] = self.ctx.Queue()
+        pending = self.unacked[index]
+        dropped = [update_id for update_id in pending if update_id in self.redelivered]
+        for update_id in dropped:
+            del pending[update_id]
+            self.redelivered.discard(update_id)
+        if dropped:
+            logger.error(f"Обновления {dropped} повторно не обработаны воркером #{index} и отброшены")
+        for update_id, item in pending.items():
+            self.redelivered.add(update_id)
+            self.queues[index].put(item)
+        if pending:
+            logger.warning(f"Воркеру #{index} повторно отправлено необработанных обновлений: {len(pending)} "
+                           f"({min(pending)}–{max(pending)})")
+        self._start_worker(index)
+
+    async def _watch(self):
+        while not self.stopping.is_set():
+            self._drain_acks()
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    self._restart_worker(index)
+                worker_queue_depth.set(self.queue_depth(index), worker=index)
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _status(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'workers': [
+                {
+                    'index': index,
+                    'pid': process.pid,
+                    'alive': process.is_alive(),
+                    'queue_depth': self.queue_depth(index),
+                    'unacked': len(self.unacked[index]),
+                    'restarts': self.restarts[index],
+                }
+                for index, process in enumerate(self.processes)
+            ]
+        })
+
+    async def _serve_status(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_get('/status', self._status)
+        app.router.add_get('/metrics', metrics_handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, port=SUPERVISOR_STATUS_PORT).start()
+        return runner
+
+    async def _stop_workers(self):
+        for q in self.queues:
+            q.put(STOP)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, 30)
+            if process.is_alive():
+                process.terminate()
+
+    async def _start_singleton_tasks(self):
+        """Команды, очистка FSM и сборщик резервов — один раз на бот, а не в каждом воркере"""
+        from src.init_django import setup_django
+        from src.main import create_bot, start_singleton_tasks
+
+        if not setup_django():
+            logger.error("Не удалось инициализировать Django. Выход...")
+            sys.exit(1)
+        bot = create_bot()
+        await start_singleton_tasks(bot, {})
+        return bot
+
+    async def run(self):
+        from src.main import stop_background_tasks
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+        bot = await self._start_singleton_tasks()
+        for index in range(len(self.queues)):
+            self._start_worker(index)
+        runner = await self._serve_status()
+        logger.info(f"Супервизор запущен: {len(self.queues)} воркеров, статус на :{SUPERVISOR_STATUS_PORT}/status")
+
+        poll = asyncio.create_task(self._poll())
+        await self._watch()
+        poll.cancel()
+        await asyncio.gather(poll, return_exceptions=True)
+        await self._stop_workers()
+        await runner.cleanup()
+        await stop_background_tasks()
+        await bot.session.close()
+        logger.info("Супервизор остановлен")
+
+
+if __name__ == "__main__":
+    asyncio.run(Supervisor(os.getenv("TELEGRAM_BOT_TOKEN"), SHARD_WORKERS).run())
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+from django.db.models.signals import post_delete, post_save
+
+from store.models import FAQ, Category, Product
+from store.signals import NON_CATALOG_FIELDS
+from ..config import CATALOG_CACHE_TTL
+from ..logger import logger
+from .catalog_reader import CachedCategory, CachedFAQ, CachedProduct, CatalogReader, catalog_reader
+from .paginator import AsyncPaginator
+
+
+class CatalogCache:
+    """
+    Кэш дерева категорий, списков товаров и FAQ в памяти процесса бота.
+
+    Актуальность проверяется по глобальной версии каталога (CatalogVersion) не чаще,
+    чем раз в ttl секунд. Изменения, сделанные в этом же процессе, сбрасывают кэш сразу
+    через сигналы post_save/post_delete.
+    """
+
+    def __init__(self, ttl: float, reader: CatalogReader):
+        self.ttl = ttl
+        self.reader = reader
+        self.version: int | None = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+        self._categories: dict[int, CachedCategory] = {}
+        self._children: dict[int | None, list[CachedCategory]] = {}
+        self._faqs: dict[int, CachedFAQ] = {}
+        self._product_counts: dict[int, int] = {}
+        # (категория, размер страницы, смещение) -> товары страницы
+        self._product_pages: dict[tuple[int, int, int], list[CachedProduct]] = {}
+
+    def invalidate(self, *args, update_fields=None, **kwargs):
+        """Помечает кэш устаревшим. Подходит как receiver для сигналов Django"""
+        if update_fields is not None and set(update_fields) <= NON_CATALOG_FIELDS:
+            return
+        self._stale = True
+
+    def _is_fresh(self) -> bool:
+        return not self._stale and time.monotonic() - self._checked_at < self.ttl
+
+    async def _ensure_fresh(self):
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            stale, self._stale = self._stale, False
+            version = await self.reader.version()
+            if stale or version != self.version:
+                await self._load()
+                self._product_counts.clear()
+                self._product_pages.clear()
+                self.version = version
+                logger.info(f"Кэш каталога загружен, версия {version}")
+            self._checked_at = time.monotonic()
+
+    async def _load(self):
+        categories = {}
+        children = {}
+        for category in await self.reader.categories():
+            categories[category.id] = category
+            children.setdefault(category.parent_id, []).append(category)
+        self._categories = categories
+        self._children = children
+        self._faqs = {faq.id: faq for faq in await self.reader.faqs()}
+
+    async def preload(self):
+        """Загружает категории и FAQ заранее, чтобы первые обновления не ждали базу"""
+        await self._ensure_fresh()
+
+    async def get_categories(self, parent_id: int | None = None) -> list[CachedCategory]:
+        await self._ensure_fresh()
+        return self._children.get(parent_id or None, [])
+
+    async def get_category(self, category_id: int) -> CachedCategory | None:
+        await self._ensure_fresh()
+        return self._categories.get(category_id)
+
+    async def get_faqs(self) -> list[CachedFAQ]:
+        await self._ensure_fresh()
+        return list(self._faqs.values())
+
+    async def get_faq(self, faq_id: int) -> CachedFAQ | None:
+        await self._ensure_fresh()
+        return self._faqs.get(faq_id)
+
+    def _remember(self, version: int | None, storage: dict, key, value):
+        # за время запроса кэш мог быть сброшен — тогда результат не сохраняем
+        if self.version == version and not self._stale:
+            storage[key] = value
+
+    async def get_products_page(
+            self, category_id: int, page: int, page_size: int
+    ) -> tuple[list[CachedProduct], int, int]:
+        """Возвращает (товары страницы, номер страницы, всего страниц)"""
+        await self._ensure_fresh()
+        version = self.version
+
+        async def count() -> int:
+            value = self._product_counts.get(category_id)
+            if value is None:
+                value = await self.reader.product_count(category_id)
+                self._remember(version, self._product_counts, category_id, value)
+            return value
+
+        async def fetch(offset: int, limit: int) -> list[CachedProduct]:
+            key = (category_id, limit, offset)
+            items = self._product_pages.get(key)
+            if items is None:
+                items = await self.reader.product_page(category_id, offset, limit)
+                self._remember(version, self._product_pages, key, items)
+            return items
+
+        paginator = AsyncPaginator(count, fetch, page_size)
+        items, page = await paginator.get_page(page)
+        return items, page, paginator.total_pages
+
+
+catalog_cache = CatalogCache(CATALOG_CACHE_TTL, catalog_reader)
+
+for _model in (Category, Product, FAQ):
+    post_save.connect(catalog_cache.invalidate, sender=_model, dispatch_uid=f'catalog_cache_save_{_model.__name__}')
+    post_delete.connect(catalog_cache.invalidate, sender=_model, dispatch_uid=f'catalog_cache_delete_{_model.__name__}')
@@ -0,0 +1,198 @@
+"""
+Чтение каталога для бота: дерево категорий, страницы товаров, карточка товара, FAQ.
+
+orm   — через ORM Django; каждый запрос выполняется в потоке sync_to_async.
+async — напрямую через асинхронное соединение psycopg 3 из собственного пула,
+        без перехода в поток; запросы подготавливаются на сервере (prepare=True)
+        и при повторах не разбираются заново. Только для PostgreSQL.
+
+Базу для чтения оба выбирают через роутер Django (реплики, см. store.routers).
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from decimal import Decimal
+
+from store.models import FAQ, CatalogVersion, Category, Product
+from ..config import CATALOG_READER, CATALOG_READER_POOL_SIZE
+from .instrumentation import current_stats
+
+
+@dataclass(frozen=True, slots=True)
+class CachedCategory:
+    id: int
+    name: str
+    parent_id: int | None
+
+
+@dataclass(frozen=True, slots=True)
+class CachedProduct:
+    id: int
+    description: str
+    price: Decimal
+    in_stock: bool
+
+
+@dataclass(frozen=True, slots=True)
+class CachedFAQ:
+    id: int
+    question: str
+    answer: str
+
+
+class CatalogReader(ABC):
+    @abstractmethod
+    async def version(self) -> int:
+        ...
+
+    @abstractmethod
+    async def categories(self) -> list[CachedCategory]:
+        """Все категории, по id"""
+
+    @abstractmethod
+    async def faqs(self) -> list[CachedFAQ]:
+        ...
+
+    @abstractmethod
+    async def product_count(self, category_id: int) -> int:
+        ...
+
+    @abstractmethod
+    async def product_page(self, category_id: int, offset: int, limit: int) -> list[CachedProduct]:
+        ...
+
+    @abstractmethod
+    async def product(self, product_id: int) -> Product:
+        """Товар целиком, как Product.objects.get(); нет товара — Product.DoesNotExist"""
+
+    async def close(self):
+        pass
+
+
+class OrmCatalogReader(CatalogReader):
+    async def version(self) -> int:
+        return await CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).afirst() or 0
+
+    async def categories(self) -> list[CachedCategory]:
+        return [CachedCategory(**row) async for row in Category.objects.order_by('id').values('id', 'name', 'parent_id')]
+
+    async def faqs(self) -> list[CachedFAQ]:
+        return [CachedFAQ(**row) async for row in FAQ.objects.order_by('id').values('id', 'question', 'answer')]
+
+    def _products(self, category_id: int):
+        return Product.objects.filter(category_id=category_id)
+
+    async def product_count(self, category_id: int) -> int:
+        return await self._products(category_id).acount()
+
+    async def product_page(self, category_id: int, offset: int, limit: int) -> list[CachedProduct]:
+        rows = self._products(category_id).order_by('id').values('id', 'description', 'price', 'in_stock')
+        return [CachedProduct(**row) async for row in rows[offset:offset + limit]]
+
+    async def product(self, product_id: int) -> Product:
+        return await Product.objects.aget(id=product_id)
+
+
+def _columns(model, names) -> str:
+    return ', '.join(model._meta.get_field(name).column for name in names)
+
+
+class PostgresAsyncCatalogReader(CatalogReader):
+    """Те же запросы, что у OrmCatalogReader, на асинхронном драйвере"""
+
+    def __init__(self, pool_size: int):
+        self.pool_size = pool_size
+        self._pools = {}
+        self._pools_lock = asyncio.Lock()
+        product_fields = Product._meta.concrete_fields
+        self._product_attnames = [f.attname for f in product_fields]
+        product_table = Product._meta.db_table
+        self._sql = {
+            'version': f'SELECT version FROM {CatalogVersion._meta.db_table} WHERE id = 1',
+            'categories': f"SELECT {_columns(Category, ('id', 'name', 'parent'))} "
+                          f"FROM {Category._meta.db_table} ORDER BY id",
+            'faqs': f"SELECT {_columns(FAQ, ('id', 'question', 'answer'))} FROM {FAQ._meta.db_table} ORDER BY id",
+            'product_count': f'SELECT count(*) FROM {product_table} WHERE category_id = %s',
+            'product_page': f"SELECT {_columns(Product, ('id', 'description', 'price', 'in_stock'))} "
+                            f"FROM {product_table} WHERE category_id = %s ORDER BY id LIMIT %s OFFSET %s",
+            'product': f"SELECT {', '.join(f.column for f in product_fields)} FROM {product_table} WHERE id = %s",
+        }
+
+    async def _get_pool(self, alias: str):
+        pool = self._pools.get(alias)
+        if pool is not None:
+            return pool
+        async with self._pools_lock:
+            if alias in self._pools:
+                return self._pools[alias]
+            from django.db import connections
+            from psycopg_pool import AsyncConnectionPool
+
+            # параметры подключения те же, что у Django, без его синхронных классов курсора
+            params = connections[alias].get_connection_params()
+            kwargs = {key: value for key, value in params.items()
+                      if key not in ('cursor_factory', 'context', 'prepare_threshold')}
+            pool = AsyncConnectionPool(kwargs={**kwargs, 'autocommit': True}, min_size=1,
+                                       max_size=self.pool_size, open=False, name=f'catalog-{alias}')
+            await pool.open()
+            self._pools[alias] = pool
+        return pool
+
+    async def _fetch(self, name: str, model, params: tuple = ()) -> tuple[str, list[tuple]]:
+        """(база, строки); базу выбирает роутер Django, как для запроса через ORM"""
+        from django.db import router
+
+        alias = router.db_for_read(model)
+        pool = await self._get_pool(alias)
+        start = time.perf_counter()
+        try:
+            async with pool.connection() as conn:
+                cursor = await conn.execute(self._sql[name], params, prepare=True)
+                return alias, await cursor.fetchall()
+        finally:
+            # запрос идёт мимо Django — учитываем его в статистике обновления сами
+            stats = current_stats.get()
+            if stats is not None:
+                stats.queries += 1
+                stats.db_time += time.perf_counter() - start
+
+    async def version(self) -> int:
+        _, rows = await self._fetch('version', CatalogVersion)
+        return rows[0][0] if rows else 0
+
+    async def categories(self) -> list[CachedCategory]:
+        _, rows = await self._fetch('categories', Category)
+        return [CachedCategory(*row) for row in rows]
+
+    async def faqs(self) -> list[CachedFAQ]:
+        _, rows = await self._fetch('faqs', FAQ)
+        return [CachedFAQ(*row) for row in rows]
+
+    async def product_count(self, category_id: int) -> int:
+        _, rows = await self._fetch('product_count', Product, (category_id,))
+        return rows[0][0]
+
+    async def product_page(self, category_id: int, offset: int, limit: int) -> list[CachedProduct]:
+        _, rows = await self._fetch('product_page', Product, (category_id, limit, offset))
+        return [CachedProduct(*row) for row in rows]
+
+    async def product(self, product_id: int) -> Product:
+        alias, rows = await self._fetch('product', Product, (product_id,))
+        if not rows:
+            raise Product.DoesNotExist(f"Товар {product_id} не найден")
+        return Product.from_db(alias, self._product_attnames, rows[0])
+
+    async def close(self):
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            await pool.close()
+
+
+def create_catalog_reader() -> CatalogReader:
+    if CATALOG_READER == 'async':
+        return PostgresAsyncCatalogReader(CATALOG_READER_POOL_SIZE)
+    return OrmCatalogReader()
+
+
+catalog_reader = create_catalog_reader()
@@ -0,0 +1,72 @@
+"""
+Пул соединений Django (DB_POOL=1, см. TelegramStore/settings.py) в процессе бота.
+
+Запросов вне HTTP у бота нет, поэтому Django сам не возвращает соединение в пул:
+поток sync_to_async держал бы его бессрочно и не проверял. Middleware возвращает
+соединение после каждого обновления, следующее возьмёт из пула проверенное.
+"""
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+from asgiref.sync import sync_to_async
+
+from .metrics import Gauge
+
+# метки pool.get_stats(); нулевые счётчики psycopg_pool не возвращает
+POOL_STATS = {
+    'pool_size': 'Открытых соединений в пуле',
+    'pool_available': 'Свободных соединений в пуле',
+    'pool_max': 'Максимальный размер пула',
+    'requests_waiting': 'Ожидающих свободного соединения',
+    'requests_num': 'Выдач соединений из пула',
+    'requests_queued': 'Выдач, которым пришлось ждать',
+    'requests_wait_ms': 'Суммарное ожидание соединения, мс',
+    'requests_errors': 'Ошибок получения соединения (таймаут пула)',
+    'connections_lost': 'Соединений, не прошедших проверку',
+    'connections_errors': 'Ошибок открытия соединения',
+}
+
+
+def _pool():
+    from django.db import connections
+
+    return connections['default'].pool
+
+
+def pool_enabled() -> bool:
+    return _pool() is not None
+
+
+def _stat(name: str) -> Callable[[], float]:
+    return lambda: _pool().get_stats().get(name, 0)
+
+
+def _close_connections():
+    from django.db import close_old_connections
+
+    close_old_connections()
+
+
+class ReleaseConnectionMiddleware(BaseMiddleware):
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            # с CONN_MAX_AGE=0 close() возвращает соединение в пул, а не разрывает его
+            await sync_to_async(_close_connections)()
+
+
+def setup_db_pool(dispatcher: Dispatcher) -> bool:
+    """Подключает возврат соединений и метрики пула; False, если пул не настроен"""
+    if not pool_enabled():
+        return False
+    dispatcher.update.outer_middleware(ReleaseConnectionMiddleware())
+    for name, documentation in POOL_STATS.items():
+        Gauge(f'bot_db_{name}', documentation, _stat(name))
+    return True
@@ -0,0 +1,134 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from redis.asyncio import Redis
+
+from ..config import DETAIL_STORE_BACKEND, DETAIL_STORE_MAX_SIZE, DETAIL_STORE_TTL, REDIS_URL
+from .metrics import Counter, Gauge
+
+detail_store_size = Gauge('bot_detail_store_size', 'Количество чатов с запомненной карточкой товара')
+detail_store_evictions = Counter('bot_detail_store_evictions_total', 'Вытеснения из хранилища карточек товара')
+
+
+class DetailMessageStore(ABC):
+    """Хранит id последней карточки товара, отправленной в чат"""
+
+    @abstractmethod
+    async def get(self, chat_id: int) -> int | None:
+        ...
+
+    @abstractmethod
+    async def set(self, chat_id: int, message_id: int):
+        ...
+
+    @abstractmethod
+    async def pop(self, chat_id: int) -> int | None:
+        ...
+
+
+class MemoryDetailMessageStore(DetailMessageStore):
+    """LRU с TTL в памяти процесса; размер ограничен max_size записями"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[int, tuple[int, float]] = OrderedDict()
+
+    async def get(self, chat_id: int) -> int | None:
+        entry = self._data.get(chat_id)
+        if entry is None:
+            return None
+        message_id, expires_at = entry
+        if expires_at < time.monotonic():
+            self._evict(chat_id, reason='ttl')
+            return None
+        self._data.move_to_end(chat_id)
+        return message_id
+
+    async def set(self, chat_id: int, message_id: int):
+        self._data[chat_id] = (message_id, time.monotonic() + self.ttl)
+        self._data.move_to_end(chat_id)
+        while len(self._data) > self.max_size:
+            self._evict(next(iter(self._data)), reason='size')
+        detail_store_size.set(len(self._data), backend='memory')
+
+    async def pop(self, chat_id: int) -> int | None:
+        message_id = await self.get(chat_id)
+        self._data.pop(chat_id, None)
+        detail_store_size.set(len(self._data), backend='memory')
+        return message_id
+
+    def _evict(self, chat_id: int, reason: str):
+        del self._data[chat_id]
+        detail_store_evictions.inc(backend='memory', reason=reason)
+
+
+# KEYS: ключ записи, индекс; ARGV: message_id, ttl, время, max_size, chat_id, префикс ключей.
+# Запись, чистка индекса и вытеснение — одним скриптом: между вытеснением и удалением ключей
+# никто не успеет записать вытесняемый чат заново. Возвращает {размер, вытеснено}.
+_SET_SCRIPT = """
+local ttl = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+redis.call('ZADD', KEYS[2], now, ARGV[5])
+-- записи с истёкшим TTL убираем из индекса
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - ttl)
+local size = redis.call('ZCARD', KEYS[2])
+local evicted = 0
+local excess = size - tonumber(ARGV[4])
+if excess > 0 then
+    local members = redis.call('ZPOPMIN', KEYS[2], excess)
+    for i = 1, #members, 2 do
+        redis.call('DEL', ARGV[6] .. ':' .. members[i])
+        evicted = evicted + 1
+    end
+end
+return {size - evicted, evicted}
+"""
+
+
+class RedisDetailMessageStore(DetailMessageStore):
+    """
+    Хранилище в Redis, общее для нескольких процессов бота. Каждая запись — ключ с TTL,
+    а sorted set с временем записи ограничивает общее количество чатов.
+    """
+
+    def __init__(self, redis: Redis, max_size: int, ttl: int, prefix: str = 'bot:detail_message'):
+        self.redis = redis
+        self.max_size = max_size
+        self.ttl = ttl
+        self.prefix = prefix
+        self.index_key = f'{prefix}:index'
+        self._set = redis.register_script(_SET_SCRIPT)
+
+    def _key(self, chat_id: int | str) -> str:
+        return f'{self.prefix}:{chat_id}'
+
+    async def get(self, chat_id: int) -> int | None:
+        value = await self.redis.get(self._key(chat_id))
+        return int(value) if value is not None else None
+
+    async def set(self, chat_id: int, message_id: int):
+        size, evicted = await self._set(
+            keys=[self._key(chat_id), self.index_key],
+            args=[message_id, self.ttl, time.time(), self.max_size, chat_id, self.prefix],
+        )
+        if evicted:
+            detail_store_evictions.inc(evicted, backend='redis', reason='size')
+        detail_store_size.set(size, backend='redis')
+
+    async def pop(self, chat_id: int) -> int | None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.getdel(self._key(chat_id))
+            pipe.zrem(self.index_key, chat_id)
+            pipe.zcard(self.index_key)
+            value, _, size = await pipe.execute()
+        detail_store_size.set(size, backend='redis')
+        return int(value) if value is not None else None
+
+
+def create_detail_message_store() -> DetailMessageStore:
+    if DETAIL_STORE_BACKEND == 'redis':
+        return RedisDetailMessageStore(Redis.from_url(REDIS_URL), DETAIL_STORE_MAX_SIZE, DETAIL_STORE_TTL)
+    return MemoryDetailMessageStore(DETAIL_STORE_MAX_SIZE, DETAIL_STORE_TTL)
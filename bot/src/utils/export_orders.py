@@ -1,40 +1,155 @@
 import asyncio
+import csv
+import gzip
+from datetime import date
 from pathlib import Path
 
+from ..config import (
+    ORDERS_CSV_PATH,
+    ORDERS_EXPORT_BATCH_SIZE,
+    ORDERS_EXPORT_FLUSH_INTERVAL,
+    ORDERS_EXPORT_GZIP,
+)
+from ..logger import logger
 
-async def save_to_csv_async(order, path: Path):
-    from store.models import Order
-    """Асинхронно добавляет заказ в CSV"""
-    loop = asyncio.get_running_loop()
-
-    # Загружаем связанные объекты для заказа
-    order = await Order.objects.select_related('cart__user').aget(id=order.id)
-
-    lines = []
-    # Получаем элементы заказа с продуктами
-    async for item in order.items.select_related('product'):
-        line = (
-            f"{order.id},{order.cart.user.chat_id},"
-            f"\"{order.cart.user.username}\",{order.status},"
-            f"{order.total_amount},{order.created_at.isoformat()},"
-            f"{item.product.id},\"{item.product.description}\","
-            f"{item.quantity},{item.price},{item.quantity * item.price}\n"
-        )
-        lines.append(line)
-
-    await loop.run_in_executor(
-        None,
-        lambda: save_csv_sync(path, lines)  # Убрали лишний аргумент
-    )
+CSV_HEADERS = (
+    'order_id', 'user_chat_id', 'user_username', 'status', 'total_amount',
+    'created_at', 'product_id', 'product_name', 'quantity', 'price', 'line_total',
+)
+
+
+def daily_path(base: Path, day: date, compress: bool, worker: int | None = None) -> Path:
+    """orders.csv -> orders-2024-01-31.csv[.gz]; у воркера #1 — orders-2024-01-31-w1.csv[.gz]"""
+    name = f"{base.stem}-{day.isoformat()}"
+    if worker is not None:
+        name += f"-w{worker}"
+    name += base.suffix
+    if compress:
+        name += '.gz'
+    return base.with_name(name)
 
 
-def save_csv_sync(path: Path, lines: list):
+def write_rows(path: Path, rows: list, compress: bool = False):
+    """Дописывает строки в CSV; заголовок пишется только в новый файл"""
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, 'a', encoding='utf-8') as f:
-        if path.stat().st_size == 0:  # Если файл новый
-            headers = (
-                "order_id,user_chat_id,user_username,status,total_amount,"
-                "created_at,product_id,product_name,quantity,price,line_total\n"
-            )
-            f.write(headers)
-        f.writelines(lines)
+    is_new = not path.exists() or path.stat().st_size == 0
+    # gzip допускает дозапись: каждый вызов добавляет отдельный member
+    opener = gzip.open if compress else open
+    with opener(path, 'at', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        if is_new:
+            writer.writerow(CSV_HEADERS)
+        writer.writerows(rows)
+
+
+async def fetch_rows(order_ids: list) -> list:
+    """Строки CSV для пачки заказов одним запросом"""
+    from store.models import OrderItem
+
+    rows = []
+    items = (
+        OrderItem.objects
+        .filter(order_id__in=order_ids)
+        .select_related('order__user', 'product')
+        .order_by('order_id', 'id')
+    )
+    async for item in items:
+        order = item.order
+        rows.append((
+            order.id, order.user.chat_id, order.user.username, order.status,
+            order.total_amount, order.created_at.isoformat(),
+            item.product.id, item.product.description,
+            item.quantity, item.price, item.quantity * item.price,
+        ))
+    return rows
+
+
+class OrderExporter:
+    """
+    Единственный писатель CSV-выгрузки заказов в процессе.
+    Хэндлеры только кладут id заказа в очередь, фоновая задача копит их
+    и пишет пачкой — по размеру пачки или по таймеру.
+
+    При нескольких процессах (супервизор, webhook с WEBHOOK_WORKERS > 1) у каждого воркера
+    свой файл: дозапись из разных процессов в один файл перемешала бы строки и члены gzip.
+    Пачка, которую не удалось записать, остаётся в очереди и пишется следующей попыткой.
+    """
+
+    def __init__(self, base_path: Path, batch_size: int = 100,
+                 flush_interval: float = 5.0, compress: bool = False):
+        self.base_path = base_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._worker: int | None = None
+
+    def start(self, worker: int | None = None):
+        """worker — номер процесса-воркера, если процессов несколько"""
+        if self._task is None:
+            self._worker = worker
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, order_id: int):
+        """Ставит заказ в очередь на выгрузку, не дожидаясь записи"""
+        if self._queue is None:
+            logger.warning(f"Экспорт заказов не запущен, заказ #{order_id} не выгружен")
+            return
+        self._queue.put_nowait(order_id)
+
+    async def close(self):
+        """Дописывает всё, что осталось в очереди, и останавливает задачу"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        pending = []
+        stopping = False
+        failed = False
+        while not stopping:
+            deadline = loop.time() + self.flush_interval
+            # после ошибки следующая попытка — не раньше чем через flush_interval
+            while failed or len(pending) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    order_id = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if order_id is None:
+                    stopping = True
+                    break
+                pending.append(order_id)
+            if pending:
+                failed = not await self._flush(pending)
+                if not failed:
+                    pending = []
+        if failed:
+            logger.error(f"Заказы не выгружены при остановке: {pending}")
+
+    async def _flush(self, order_ids: list) -> bool:
+        try:
+            rows = await fetch_rows(order_ids)
+            path = daily_path(self.base_path, date.today(), self.compress, self._worker)
+            await asyncio.to_thread(write_rows, path, rows, self.compress)
+            logger.info(f"Выгружено заказов: {len(order_ids)} ({len(rows)} строк) в {path.name}")
+            return True
+        except Exception:
+            logger.exception(f"Ошибка выгрузки заказов {order_ids}, повторим через {self.flush_interval} с")
+            return False
+
+
+order_exporter = OrderExporter(
+    ORDERS_CSV_PATH,
+    batch_size=ORDERS_EXPORT_BATCH_SIZE,
+    flush_interval=ORDERS_EXPORT_FLUSH_INTERVAL,
+    compress=ORDERS_EXPORT_GZIP,
+)
@@ -0,0 +1,131 @@
+"""
+Время обработки обновлений и запросы к базе в разрезе хэндлеров.
+
+Outer-middleware на Dispatcher.update заводит для обновления UpdateStats в contextvar;
+execute_wrapper Django дописывает туда число запросов и время в базе. sync_to_async
+копирует контекст в поток, поэтому запросы из @sync_to_async и async ORM попадают
+в статистику своего обновления.
+"""
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from .metrics import Counter, Histogram
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+handler_duration = Histogram('bot_handler_duration_seconds', 'Время обработки обновления')
+handler_errors = Counter('bot_handler_errors_total', 'Обновлений, завершившихся исключением')
+update_db_queries = Histogram('bot_update_db_queries', 'Запросов к базе на обновление', QUERY_BUCKETS)
+update_db_seconds = Histogram('bot_update_db_seconds', 'Время в базе на обновление')
+
+# add_item_15 -> add_item, faq:3 -> faq: числа в callback_data не превращаются в метки
+_CALLBACK_ID = re.compile(r'[_:]?-?\d+.*$')
+# метка для текста, похожего на команду, но не из списка команд бота
+OTHER_COMMAND = 'other'
+
+
+@dataclass
+class UpdateStats:
+    handler: str = 'unhandled'
+    prefix: str = ''
+    queries: int = 0
+    db_time: float = 0.0
+
+
+current_stats: ContextVar[UpdateStats | None] = ContextVar('current_stats', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """execute_wrapper: учитывает запрос в статистике текущего обновления"""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    # соединение переподключается на каждый запрос (CONN_MAX_AGE=0), обёртку ставим один раз
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def _event_prefix(event: TelegramObject | None, commands: frozenset[str]) -> str:
+    if isinstance(event, CallbackQuery) and event.data:
+        return _CALLBACK_ID.sub('', event.data)
+    if isinstance(event, Message) and event.text and event.text.startswith('/'):
+        # текст пишет пользователь: каждая новая метка — новые серии гистограмм навсегда
+        command = event.text.split()[0].split('@')[0]
+        return command if command in commands else OTHER_COMMAND
+    return ''
+
+
+class HandlerLabelMiddleware(BaseMiddleware):
+    """Inner-middleware: к этому моменту фильтры пройдены и известен выбранный хэндлер"""
+
+    def __init__(self, commands: frozenset[str]):
+        self.commands = commands
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any],
+    ) -> Any:
+        stats = current_stats.get()
+        if stats is not None:
+            callback = data['handler'].callback
+            stats.handler = f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+            stats.prefix = _event_prefix(event, self.commands)
+        return await handler(event, data)
+
+
+class InstrumentationMiddleware(BaseMiddleware):
+    """Outer-middleware на Dispatcher.update: время обработки и запросы к базе"""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: dict[str, Any],
+    ) -> Any:
+        stats = UpdateStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(handler=stats.handler)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            current_stats.reset(token)
+            labels = {'event': event.event_type, 'handler': stats.handler, 'prefix': stats.prefix}
+            handler_duration.observe(elapsed, **labels)
+            update_db_queries.observe(stats.queries, **labels)
+            update_db_seconds.observe(stats.db_time, **labels)
+
+
+def setup_instrumentation(dispatcher: Dispatcher, commands: Iterable[str]):
+    """
+    Подключает замеры к диспетчеру и ко всем соединениям Django.
+    commands — команды бота без «/»: только они попадают в метку prefix как есть
+    """
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(_install_query_counter, dispatch_uid='bot_count_queries')
+    dispatcher.update.outer_middleware(InstrumentationMiddleware())
+    label = HandlerLabelMiddleware(frozenset(f'/{command}' for command in commands))
+    for name, observer in dispatcher.observers.items():
+        if name not in ('update', 'error'):
+            observer.middleware(label)
@@ -0,0 +1,134 @@
+import threading
+from typing import Callable
+
+from aiohttp import web
+
+# Все созданные метрики процесса
+registry: list['_Metric'] = []
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+        registry.append(self)
+
+    @staticmethod
+    def _key(labels: dict) -> tuple[tuple[str, str], ...]:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[tuple[str, tuple[tuple[str, str], ...], float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Текущее значение; можно задать функцию, которая вычисляет его при чтении"""
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], float] | None = None):
+        super().__init__(name, documentation)
+        self._func = func
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self._func is not None:
+            return [(self.name, (), float(self._func()))]
+        return super().samples()
+
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам le, плюс сумма и количество"""
+    type = 'histogram'
+    DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # по ключу меток: счётчики корзин (кумулятивно при выводе), сумма, количество
+        self._observations: dict[tuple[tuple[str, str], ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._observations.get(key)
+            if state is None:
+                state = self._observations[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def value(self, **labels) -> float:
+        """Количество наблюдений"""
+        state = self._observations.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total, count) in self._observations.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    result.append((f'{self.name}_bucket', key + (('le', repr(float(bound))),), cumulative))
+                result.append((f'{self.name}_bucket', key + (('le', '+Inf'),), count))
+                result.append((f'{self.name}_sum', key, total))
+                result.append((f'{self.name}_count', key, count))
+        return result
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render() -> str:
+    """Все метрики процесса в текстовом формате Prometheus"""
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {_escape(metric.documentation)}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.samples():
+            if labels:
+                rendered = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f'{name}{{{rendered}}} {value}')
+            else:
+                lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+async def start_metrics_server(port: int) -> web.AppRunner:
+    """Отдельный HTTP-сервер только с /metrics — для режимов без своего aiohttp-приложения"""
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    return runner
@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import Awaitable, Callable, List, Tuple
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 
@@ -9,9 +9,13 @@ class Paginator:
         self.page_size = page_size
         self.total_pages = (len(data) + page_size - 1) // page_size
 
+    def clamp_page(self, page: int) -> int:
+        """Приводит номер страницы к допустимому диапазону"""
+        return max(1, min(page, self.total_pages))
+
     def get_page(self, page: int) -> Tuple[List, int]:
         """Возвращает элементы для страницы и номер страницы"""
-        page = max(1, min(page, self.total_pages))
+        page = self.clamp_page(page)
         start = (page - 1) * self.page_size
         end = start + self.page_size
         return self.data[start:end], page
@@ -52,3 +56,24 @@ class Paginator:
 
         builder.adjust(3, 1)  # 3 кнопки в первом ряду, 1 во втором
         return builder
+
+
+class AsyncPaginator(Paginator):
+    """
+    Пагинатор, который читает только запрошенную страницу: количество и срез берутся
+    асинхронными функциями (запрос к базе, кэш). count() -> число элементов,
+    fetch(offset, limit) -> элементы страницы. Клавиатура строится так же, как у Paginator.
+    """
+
+    def __init__(self, count: Callable[[], Awaitable[int]],
+                 fetch: Callable[[int, int], Awaitable[list]], page_size: int = 5):
+        self.count = count
+        self.fetch = fetch
+        self.page_size = page_size
+        self.total_pages = 0
+
+    async def get_page(self, page: int) -> Tuple[List, int]:
+        """Возвращает элементы для страницы и номер страницы"""
+        self.total_pages = (await self.count() + self.page_size - 1) // self.page_size
+        page = self.clamp_page(page)
+        return await self.fetch((page - 1) * self.page_size, self.page_size), page
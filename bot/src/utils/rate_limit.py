@@ -0,0 +1,373 @@
+"""
+Планировщик исходящих запросов к Telegram Bot API.
+
+Все запросы бота с chat_id проходят через общий глобальный bucket и bucket своего чата
+(для групп — отдельный, более строгий лимит). Ответы пользователю идут раньше фоновой
+работы, TelegramRetryAfter переводит чат (или весь бот) на паузу и запрос повторяется.
+
+Лимиты — на весь бот. memory: bucket'ы в памяти процесса; воркеры супервизора делят
+глобальный лимит поровну, а чаты за ними закреплены. redis: bucket'ы общие для всех
+процессов — нужно для webhook с WEBHOOK_WORKERS > 1, где обновления чата попадают в любой воркер.
+"""
+import asyncio
+import bisect
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from ..config import (
+    OUTBOUND_CHAT_BURST,
+    OUTBOUND_CHAT_RATE,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_GROUP_BURST,
+    OUTBOUND_GROUP_RATE,
+    OUTBOUND_LIMITS_BACKEND,
+    OUTBOUND_MAX_RETRIES,
+    REDIS_URL,
+)
+from ..logger import logger
+from .metrics import Counter, Gauge
+
+# чем меньше число, тем раньше запрос уйдёт
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+outbound_priority: ContextVar[int] = ContextVar('outbound_priority', default=PRIORITY_INTERACTIVE)
+
+# сколько бездействующих bucket'ов чатов держать, прежде чем чистить полные
+_MAX_IDLE_BUCKETS = 10_000
+
+
+@contextmanager
+def background_priority():
+    """Запросы внутри блока уступают очередь ответам пользователям"""
+    token = outbound_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        outbound_priority.reset(token)
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд появится токен; 0 — можно отправлять сейчас"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float):
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated = now
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+outbound_wait_seconds = Counter('bot_outbound_queue_wait_seconds_total',
+                                'Суммарное ожидание исходящих запросов в очереди планировщика')
+outbound_requests = Counter('bot_outbound_requests_total', 'Исходящих запросов, прошедших планировщик')
+outbound_retry_after = Counter('bot_outbound_retry_after_total', 'Ответов TelegramRetryAfter')
+
+
+class OutboundScheduler:
+    """Выдаёт разрешение на отправку в порядке приоритета с учётом всех bucket'ов"""
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE,
+                 chat_rate: float = OUTBOUND_CHAT_RATE, chat_burst: float = OUTBOUND_CHAT_BURST,
+                 group_rate: float = OUTBOUND_GROUP_RATE, group_burst: float = OUTBOUND_GROUP_BURST):
+        self.global_rate = global_rate
+        self.chat_limits = (chat_rate, chat_burst)
+        self.group_limits = (group_rate, group_burst)
+        self._global: TokenBucket | None = None
+        self._chats: dict[int | str, TokenBucket] = {}
+        # отсортированная очередь (priority, seq, chat_id, future, enqueued_at)
+        self._waiters: list[tuple] = []
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def queue_size(self) -> int:
+        return len(self._waiters)
+
+    def share_global_rate(self, processes: int):
+        """Глобальный лимит поровну на processes процессов, у каждого из которых свои bucket'ы"""
+        if self._global is not None:
+            raise RuntimeError("Лимит делится до первого запроса")
+        self.global_rate /= processes
+
+    @staticmethod
+    def _is_group(chat_id: int | str) -> bool:
+        # у групп и каналов отрицательный id, у публичных каналов можно указать @username
+        return isinstance(chat_id, str) or chat_id < 0
+
+    def _bucket(self, chat_id: int | str, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            rate, burst = self.group_limits if self._is_group(chat_id) else self.chat_limits
+            bucket = self._chats[chat_id] = TokenBucket(rate, burst, now)
+        return bucket
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            loop = asyncio.get_running_loop()
+            # доля процесса может быть меньше 1 сообщения в секунду, а запас нужен хотя бы на одно
+            self._global = self._global or TokenBucket(self.global_rate, max(1.0, self.global_rate), loop.time())
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def acquire(self, chat_id: int | str, priority: int):
+        """Ждёт, пока запрос в chat_id можно отправить"""
+        self._ensure_running()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = (priority, next(self._seq), chat_id, future, loop.time())
+        bisect.insort(self._waiters, entry, key=lambda e: (e[0], e[1]))
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            raise
+
+    async def pause(self, chat_id: int | str | None, seconds: float):
+        """retry_after от Telegram: придерживаем чат, а без чата — все запросы"""
+        self._ensure_running()
+        now = asyncio.get_running_loop().time()
+        bucket = self._global if chat_id is None else self._bucket(chat_id, now)
+        bucket.pause(now, seconds)
+
+    def _prune(self, now: float):
+        if len(self._chats) > _MAX_IDLE_BUCKETS:
+            waiting = {entry[2] for entry in self._waiters}
+            for chat_id in [c for c, b in self._chats.items() if c not in waiting and b.idle(now)]:
+                del self._chats[chat_id]
+
+    async def _sleep(self, seconds: float):
+        # новый запрос может быть готов раньше — например, в другой, свободный чат
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _reserve(self, chat_id: int | str) -> tuple[float, bool]:
+        """
+        Берёт токен из глобального bucket'а и bucket'а чата, если он есть в обоих.
+        Возвращает (через сколько секунд повторить, ждём ли глобальный лимит); (0, False) — токен взят.
+        """
+        now = asyncio.get_running_loop().time()
+        global_delay = self._global.delay(now)
+        if global_delay > 0:
+            return global_delay, True
+        bucket = self._bucket(chat_id, now)
+        delay = bucket.delay(now)
+        if delay > 0:
+            return delay, False
+        self._global.take(now)
+        bucket.take(now)
+        self._prune(now)
+        return 0.0, False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            chosen, next_ready, global_wait = None, None, False
+            # снимок: пока ждём bucket'ы, очередь может измениться
+            for entry in list(self._waiters):
+                delay, global_wait = await self._reserve(entry[2])
+                if delay <= 0:
+                    chosen = entry
+                    break
+                next_ready = delay if next_ready is None else min(next_ready, delay)
+                if global_wait:
+                    break
+            if chosen is None:
+                if global_wait:
+                    await asyncio.sleep(next_ready)
+                else:
+                    await self._sleep(next_ready)
+                continue
+
+            if chosen in self._waiters:
+                self._waiters.remove(chosen)
+            priority, _, chat_id, future, enqueued_at = chosen
+            if future.done():
+                continue
+            future.set_result(None)
+            now = loop.time()
+            outbound_wait_seconds.inc(now - enqueued_at, priority=priority)
+            outbound_requests.inc(priority=priority)
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Session middleware: пропускает запросы с chat_id через планировщик и повторяет после retry_after"""
+
+    def __init__(self, scheduler: OutboundScheduler, max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        # getUpdates, answerCallbackQuery, answerPreCheckoutQuery и т.п. не адресованы чату
+        # и под лимиты сообщений не попадают
+        chat_id = getattr(method, 'chat_id', None)
+        for attempt in itertools.count():
+            if chat_id is not None:
+                await self.scheduler.acquire(chat_id, outbound_priority.get())
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                outbound_retry_after.inc(method=type(method).__name__)
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Flood control на {type(method).__name__} (чат {chat_id}), "
+                               f"пауза {e.retry_after} с")
+                await self.scheduler.pause(chat_id, e.retry_after)
+                if chat_id is None:
+                    await asyncio.sleep(e.retry_after)
+
+
+# KEYS: глобальный bucket, bucket чата; ARGV: rate и запас каждого, срок жизни bucket'а чата.
+# Время — часы Redis, одни на все процессы. Возвращает {'ok'|'global'|'chat', задержка}.
+_TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local function state(key, rate, capacity)
+    local v = redis.call('HMGET', key, 'tokens', 'updated', 'paused_until')
+    local tokens = math.min(capacity, (tonumber(v[1]) or capacity) + (now - (tonumber(v[2]) or now)) * rate)
+    local paused = tonumber(v[3]) or 0
+    if now < paused then
+        return tokens, paused - now
+    end
+    if tokens < 1 then
+        return tokens, (1 - tokens) / rate
+    end
+    return tokens, 0
+end
+local global_tokens, global_delay = state(KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[2]))
+if global_delay > 0 then
+    return {'global', tostring(global_delay)}
+end
+local chat_tokens, chat_delay = state(KEYS[2], tonumber(ARGV[3]), tonumber(ARGV[4]))
+if chat_delay > 0 then
+    return {'chat', tostring(chat_delay)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(global_tokens - 1), 'updated', tostring(now))
+redis.call('HSET', KEYS[2], 'tokens', tostring(chat_tokens - 1), 'updated', tostring(now))
+if redis.call('TTL', KEYS[2]) < tonumber(ARGV[5]) then
+    redis.call('EXPIRE', KEYS[2], ARGV[5])
+end
+return {'ok', '0'}
+"""
+
+# KEYS: bucket; ARGV: пауза, секунд, и срок жизни bucket'а после неё
+_PAUSE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local until_ = math.max(tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0, now + tonumber(ARGV[1]))
+redis.call('HSET', KEYS[1], 'tokens', '0', 'updated', tostring(now), 'paused_until', tostring(until_))
+if ARGV[2] ~= '0' then
+    redis.call('EXPIRE', KEYS[1], math.ceil(until_ - now) + tonumber(ARGV[2]))
+end
+"""
+
+
+class RedisOutboundScheduler(OutboundScheduler):
+    """
+    Bucket'ы в Redis, общие для всех процессов бота; очередь с приоритетами — своя у процесса.
+    Если Redis недоступен, процесс временно ограничивает себя bucket'ами в памяти.
+    """
+
+    # бездействующий bucket чата давно полон — ключ можно удалить
+    BUCKET_TTL = 3600
+
+    def __init__(self, redis: Redis, prefix: str = 'bot:outbound', **limits):
+        super().__init__(**limits)
+        self.redis = redis
+        self.prefix = prefix
+        self._take = redis.register_script(_TAKE_SCRIPT)
+        self._pause = redis.register_script(_PAUSE_SCRIPT)
+        self._redis_failed = False
+
+    def share_global_rate(self, processes: int):
+        # глобальный bucket и так один на все процессы
+        pass
+
+    def _key(self, chat_id: int | str | None) -> str:
+        return f'{self.prefix}:global' if chat_id is None else f'{self.prefix}:chat:{chat_id}'
+
+    def _redis_error(self, e: RedisError):
+        if not self._redis_failed:
+            logger.error(f"Лимиты исходящих запросов: Redis недоступен ({e!r}), лимиты процесса в памяти")
+            self._redis_failed = True
+
+    async def _reserve(self, chat_id: int | str) -> tuple[float, bool]:
+        rate, burst = self.group_limits if self._is_group(chat_id) else self.chat_limits
+        try:
+            scope, delay = await self._take(
+                keys=[self._key(None), self._key(chat_id)],
+                args=[self.global_rate, self.global_rate, rate, burst, self.BUCKET_TTL],
+            )
+        except RedisError as e:
+            self._redis_error(e)
+            return await super()._reserve(chat_id)
+        self._redis_failed = False
+        return float(delay), scope == b'global'
+
+    async def pause(self, chat_id: int | str | None, seconds: float):
+        try:
+            await self._pause(keys=[self._key(chat_id)],
+                              args=[seconds, 0 if chat_id is None else self.BUCKET_TTL])
+        except RedisError as e:
+            self._redis_error(e)
+            await super().pause(chat_id, seconds)
+
+
+def create_outbound_scheduler() -> OutboundScheduler:
+    if OUTBOUND_LIMITS_BACKEND == 'redis':
+        return RedisOutboundScheduler(Redis.from_url(REDIS_URL))
+    return OutboundScheduler()
+
+
+outbound_scheduler = create_outbound_scheduler()
+Gauge('bot_outbound_queue_size', 'Запросов, ожидающих отправки', outbound_scheduler.queue_size)
@@ -0,0 +1,32 @@
+"""
+Чтение каталога с реплик (DB_REPLICA_HOSTS, см. store.routers) на время обработки обновления.
+"""
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+
+class ReplicaReadsMiddleware(BaseMiddleware):
+    """Outer-middleware на Dispatcher.update: своё состояние маршрутизации у каждого обновления"""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any],
+    ) -> Any:
+        from store.routers import use_replicas
+
+        with use_replicas():
+            return await handler(event, data)
+
+
+def setup_replicas(dispatcher: Dispatcher) -> bool:
+    """Включает чтение каталога с реплик; False, если реплики не настроены"""
+    from django.conf import settings
+
+    if not settings.DATABASE_REPLICAS:
+        return False
+    dispatcher.update.outer_middleware(ReplicaReadsMiddleware())
+    return True
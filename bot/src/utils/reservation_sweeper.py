@@ -0,0 +1,25 @@
+import asyncio
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+
+from ..config import RESERVATION_SWEEP_BATCH, RESERVATION_SWEEP_INTERVAL, RESERVATION_TTL
+from ..logger import logger
+
+
+async def sweep_expired_reservations() -> int:
+    from store.models import Order
+
+    return await sync_to_async(Order.expire_pending)(timedelta(seconds=RESERVATION_TTL), RESERVATION_SWEEP_BATCH)
+
+
+async def run_reservation_sweeper():
+    """Периодически отменяет неоплаченные заказы и освобождает их резерв"""
+    while True:
+        try:
+            expired = await sweep_expired_reservations()
+            if expired:
+                logger.info(f"Отменено просроченных заказов: {expired}")
+        except Exception:
+            logger.exception("Ошибка при отмене просроченных заказов")
+        await asyncio.sleep(RESERVATION_SWEEP_INTERVAL)
@@ -0,0 +1,125 @@
+import multiprocessing
+import signal
+import sys
+from typing import Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from src.config import (
+    DETAIL_STORE_BACKEND,
+    FSM_STORAGE,
+    HEALTHCHECK_PATH,
+    METRICS_PORT,
+    OUTBOUND_LIMITS_BACKEND,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_WORKERS,
+)
+from src.logger import logger
+from src.utils.metrics import metrics_handler, start_metrics_server
+
+READY = web.AppKey('ready', bool)
+
+
+async def _set_webhook(bot: Bot, dispatcher: Dispatcher):
+    await bot.set_webhook(
+        url=WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+    logger.info(f"Webhook установлен: {WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}")
+
+
+async def _mark_ready(app: web.Application):
+    app[READY] = True
+
+
+async def _readiness(request: web.Request) -> web.Response:
+    ready = request.app[READY]
+    return web.json_response({'ready': ready}, status=200 if ready else 503)
+
+
+def _metrics_server(port: int):
+    async def serve(app: web.Application):
+        runner = await start_metrics_server(port)
+        yield
+        await runner.cleanup()
+
+    return serve
+
+
+def _serve(dispatcher: Dispatcher, bot_factory: Callable[[], Bot], worker: int):
+    """Запускает один aiohttp-сервер; при нескольких воркерах порт общий (SO_REUSEPORT)"""
+    bot = bot_factory()
+    app = web.Application()
+    app[READY] = False
+    app.router.add_get(HEALTHCHECK_PATH, _readiness)
+    if WEBHOOK_WORKERS <= 1:
+        app.router.add_get('/metrics', metrics_handler)
+    elif METRICS_PORT:
+        # общий порт отдаёт запрос случайному воркеру, и счётчики разных процессов перемешивались бы:
+        # у каждого воркера свой порт METRICS_PORT + номер, как у воркеров супервизора
+        app.cleanup_ctx.append(_metrics_server(METRICS_PORT + worker))
+
+    if worker == 0:
+        # webhook регистрирует только один воркер
+        dispatcher.startup.register(_set_webhook)
+    # хэндлеры startup выполняются по порядку — готовность отмечаем последней
+    dispatcher.startup.register(_mark_ready)
+
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    # команды, очистка FSM и сборщик резервов нужны одни на весь бот, а выгрузка заказов
+    # пишет в свой файл у каждого воркера
+    setup_application(app, dispatcher, bot=bot, singleton_tasks=worker == 0,
+                      worker=worker if WEBHOOK_WORKERS > 1 else None)
+
+    logger.info(f"Воркер webhook #{worker} слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}")
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=WEBHOOK_WORKERS > 1, print=None)
+
+
+def run_webhook(dispatcher: Dispatcher, bot_factory: Callable[[], Bot]):
+    """Запускает бота в режиме webhook в WEBHOOK_WORKERS процессах"""
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET не задан — запросы к webhook не проверяются")
+    if WEBHOOK_WORKERS <= 1:
+        _serve(dispatcher, bot_factory, 0)
+        return
+    # обновления одного чата попадают в разные процессы (SO_REUSEPORT), состояние в памяти
+    # процесса терялось бы между шагами оформления заказа и поиска
+    if FSM_STORAGE == 'memory' or DETAIL_STORE_BACKEND == 'memory':
+        logger.error(f"WEBHOOK_WORKERS={WEBHOOK_WORKERS} требует общего хранилища: задайте FSM_STORAGE=redis "
+                     f"или postgres и DETAIL_STORE_BACKEND=redis (сейчас {FSM_STORAGE} и {DETAIL_STORE_BACKEND})")
+        sys.exit(1)
+    # по той же причине лимиты чатов и общий лимит бота в памяти процесса умножались бы на число воркеров
+    if OUTBOUND_LIMITS_BACKEND != 'redis':
+        logger.error(f"WEBHOOK_WORKERS={WEBHOOK_WORKERS} требует общих лимитов исходящих запросов: "
+                     f"задайте OUTBOUND_LIMITS_BACKEND=redis (сейчас {OUTBOUND_LIMITS_BACKEND})")
+        sys.exit(1)
+
+    ctx = multiprocessing.get_context('fork')
+    workers = [
+        ctx.Process(target=_serve, args=(dispatcher, bot_factory, i), name=f'webhook-{i}')
+        for i in range(WEBHOOK_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def stop(signum, frame):
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for worker in workers:
+        worker.join()